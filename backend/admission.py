@@ -0,0 +1,79 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+import metrics
+
+# Report builds hold several 300 dpi figures and a ReportLab story in memory, so only
+# REPORT_CONCURRENCY of them run at once per process. Up to REPORT_QUEUE_SIZE more requests wait
+# for a slot, for at most REPORT_QUEUE_TIMEOUT seconds, anything beyond that gets a 503 with Retry-After.
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "2"))
+REPORT_QUEUE_SIZE = int(os.getenv("REPORT_QUEUE_SIZE", "8"))
+REPORT_QUEUE_TIMEOUT = float(os.getenv("REPORT_QUEUE_TIMEOUT", "60"))
+REPORT_RETRY_AFTER = int(os.getenv("REPORT_RETRY_AFTER", "10"))
+
+class AdmissionController:
+    """Bounded concurrency with a bounded wait queue for one kind of expensive request"""
+
+    def __init__(self, name, concurrency, queue_size, queue_timeout, retry_after):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.waiting = 0
+        self.running = 0
+        # Moving average of how long a slot is held, used to suggest a Retry-After
+        self.average_seconds = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def retry_after_seconds(self):
+        if self.average_seconds is None:
+            return self.retry_after
+        # Roughly the time until everyone already queued has had a turn
+        return max(1, math.ceil(self.average_seconds * (self.waiting + 1) / self.concurrency))
+
+    def reject(self, reason):
+        metrics.ADMISSION_REJECTED.inc(queue=self.name, reason=reason)
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy generating other reports, try again shortly",
+            headers={"Retry-After": str(self.retry_after_seconds())}
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block, waiting in the queue if they are all taken"""
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            self.reject("queue_full")
+        self.waiting += 1
+        metrics.ADMISSION_QUEUE_DEPTH.set(self.waiting, queue=self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.reject("timeout")
+        finally:
+            self.waiting -= 1
+            metrics.ADMISSION_QUEUE_DEPTH.set(self.waiting, queue=self.name)
+            metrics.ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, queue=self.name)
+
+        self.running += 1
+        metrics.ADMISSION_RUNNING.set(self.running, queue=self.name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.average_seconds = elapsed if self.average_seconds is None else 0.8 * self.average_seconds + 0.2 * elapsed
+            self.running -= 1
+            metrics.ADMISSION_RUNNING.set(self.running, queue=self.name)
+            self._semaphore.release()
+
+report_admission = AdmissionController(
+    "report", REPORT_CONCURRENCY, REPORT_QUEUE_SIZE, REPORT_QUEUE_TIMEOUT, REPORT_RETRY_AFTER
+)
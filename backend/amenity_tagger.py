@@ -0,0 +1,114 @@
+import json
+import os
+import re
+from collections import deque
+
+from text_similarity import listing_text
+
+# Deterministic amenity tags for the feature table and prompts. The vocabulary is compiled into
+# one Aho-Corasick automaton over words, so a listing's text is scanned once however many phrases
+# there are, and matches always fall on word boundaries.
+# JSON file of {"Amenity": ["phrase", ...]} that replaces DEFAULT_VOCABULARY
+AMENITY_VOCABULARY_PATH = os.getenv("AMENITY_VOCABULARY_PATH")
+AMENITY_TEXT_FIELDS = ("Interior", "Exterior", "Public Remarks", "Private Pool Description")
+
+# Phrases are matched word for word, case insensitive, with punctuation ignored, so plurals need their own entry
+DEFAULT_VOCABULARY = {
+    "Impact Windows": ["impact windows", "impact window", "impact glass", "hurricane windows", "impact resistant windows"],
+    "Hurricane Shutters": ["hurricane shutters", "accordion shutters", "storm shutters"],
+    "Waterfront": ["waterfront", "water front", "canal front", "lakefront", "lake front", "oceanfront",
+                   "ocean front", "intracoastal", "on the water", "water view", "water views"],
+    "Boat Dock": ["dock", "boat dock", "boat lift", "davits"],
+    "Renovated Kitchen": ["renovated kitchen", "updated kitchen", "remodeled kitchen", "new kitchen",
+                          "kitchen was renovated", "kitchen was updated", "kitchen remodel"],
+    "Pool Heat": ["heated pool", "pool heat", "pool heater", "solar heated pool", "pool heat pump", "heat pump pool heater"],
+    "Spa": ["spa", "hot tub", "jacuzzi"],
+    "Screened Enclosure": ["screened lanai", "screened porch", "screen enclosure", "screened enclosure", "screened patio"],
+    "New Roof": ["new roof", "roof replaced", "roof was replaced"],
+    "Solar Panels": ["solar panels", "solar system"],
+    "Generator": ["generator", "whole house generator"],
+    "Golf Course": ["golf course", "golf course view", "on the golf course"],
+    "Gated Community": ["gated community", "gated", "guard gated"],
+    "Wood Floors": ["wood floors", "hardwood floors", "wood flooring", "hardwood flooring"],
+    "Vaulted Ceilings": ["vaulted ceilings", "vaulted ceiling", "cathedral ceilings", "high ceilings"],
+    "Fireplace": ["fireplace"],
+    "Split Bedrooms": ["split bedroom", "split bedrooms", "split floor plan"],
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+def load_vocabulary(path=AMENITY_VOCABULARY_PATH):
+    if not path:
+        return DEFAULT_VOCABULARY
+    with open(path) as file:
+        return json.load(file)
+
+class AmenityTagger:
+    """Aho-Corasick automaton over the words of every vocabulary phrase, matches are bitmasks of amenity indices"""
+
+    def __init__(self, vocabulary):
+        self.amenities = list(vocabulary)
+        # goto[state] maps the next word to a state, outputs[state] is the mask of amenities ending there
+        self.goto = [{}]
+        self.outputs = [0]
+        for index, phrases in enumerate(vocabulary.values()):
+            for phrase in phrases:
+                state = 0
+                for word in WORD_PATTERN.findall(phrase.lower()):
+                    if word not in self.goto[state]:
+                        self.goto.append({})
+                        self.outputs.append(0)
+                        self.goto[state][word] = len(self.goto) - 1
+                    state = self.goto[state][word]
+                if state:
+                    self.outputs[state] |= 1 << index
+        # Failure links, breadth first so every shorter suffix is linked before it is needed
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.outputs[child] |= self.outputs[self.fail[child]]
+
+    def scan(self, text):
+        """Mask of the amenities mentioned in text, in one pass over its words"""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        found = 0
+        for word in WORD_PATTERN.findall(text.lower()):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            found |= outputs[state]
+        return found
+
+    def names(self, mask):
+        return [amenity for index, amenity in enumerate(self.amenities) if mask >> index & 1]
+
+    def tag(self, features_info):
+        """Amenity names found in one features_info dict"""
+        return self.names(self.scan(listing_text(features_info, AMENITY_TEXT_FIELDS)))
+
+    def matrix(self, features_df):
+        """
+        Boolean amenity table with one row per listing.
+
+        Returns:
+            DataFrame: Address plus one column per amenity found in at least one listing, in vocabulary order
+        """
+        import pandas as pd
+        records = features_df.to_dict(orient="records")
+        masks = [self.scan(listing_text(record, AMENITY_TEXT_FIELDS)) for record in records]
+        present = 0
+        for mask in masks:
+            present |= mask
+        columns = {"Address": [record.get("Address") for record in records]}
+        for index, amenity in enumerate(self.amenities):
+            if present >> index & 1:
+                columns[amenity] = [bool(mask >> index & 1) for mask in masks]
+        return pd.DataFrame(columns)
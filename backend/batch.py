@@ -0,0 +1,149 @@
+"""
+Generate CMA reports in bulk without the HTTP API.
+
+Run from the backend directory:
+    python batch.py jobs/ --output-dir month_end/           # one job per sub-folder of jobs/
+    python batch.py manifest.jsonl --output-dir month_end/   # one job per manifest line
+
+Directory layout: every sub-folder is a job named after the folder. The PDF whose name starts
+with "subject" is the subject property, every other PDF in the folder is a comparison.
+
+Manifest: a JSON lines file with one job per line,
+    {"id": "smith-st", "subject": "smith/subject.pdf", "comps": ["smith/a.pdf", "smith/b.pdf"]}
+Relative paths are resolved against the manifest's directory.
+
+Jobs run in a process pool. Each finished job is appended to the summary file (default
+<output-dir>/summary.jsonl) with its status and per-stage timing, and a rerun skips the jobs
+the summary already lists as done, so an interrupted run can simply be started again.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def directory_jobs(root):
+    jobs = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if not os.path.isdir(folder):
+            continue
+        pdfs = sorted(entry for entry in os.listdir(folder) if entry.lower().endswith(".pdf"))
+        subjects = [entry for entry in pdfs if entry.lower().startswith("subject")]
+        jobs.append({
+            "id": name,
+            "subject": os.path.join(folder, subjects[0]) if subjects else None,
+            "comps": [os.path.join(folder, entry) for entry in pdfs if entry not in subjects[:1]]
+        })
+    return jobs
+
+def manifest_jobs(manifest_path):
+    base_dir = os.path.dirname(manifest_path)
+    jobs = []
+    with open(manifest_path) as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            jobs.append({
+                "id": str(entry.get("id") or line_number),
+                "subject": os.path.join(base_dir, entry["subject"]),
+                "comps": [os.path.join(base_dir, path) for path in entry.get("comps", [])]
+            })
+    return jobs
+
+def completed_jobs(summary_path):
+    """IDs of the jobs a previous run already finished"""
+    done = set()
+    if not os.path.exists(summary_path):
+        return done
+    with open(summary_path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if result.get("status") == "done" and os.path.exists(result.get("report", "")):
+                done.add(result["id"])
+    return done
+
+def init_worker():
+    # Import the pipeline once per worker process instead of once per job
+    os.chdir(BACKEND_DIR)
+    import pdf_handle
+    pdf_handle.load_pyplot()
+
+def run_job(job, output_dir):
+    import pdf_handle
+    report_path = os.path.join(output_dir, f"{job['id']}.pdf")
+    result = {"id": job["id"], "report": report_path, "comps": len(job["comps"])}
+    start = time.perf_counter()
+    try:
+        if not job["subject"]:
+            raise ValueError("No subject PDF")
+        if not job["comps"]:
+            raise ValueError("No comparison PDFs")
+        result["stages"] = pdf_handle.build_report_from_paths(job["subject"], job["comps"], report_path)
+        result["status"] = "done"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate CMA reports from a directory of job folders or a JSON lines manifest")
+    parser.add_argument("source", help="Directory with one sub-folder per job, or a .jsonl manifest")
+    parser.add_argument("--output-dir", default="batch_reports", help="Where the report PDFs are written")
+    parser.add_argument("--summary", help="Summary JSON lines file, defaults to <output-dir>/summary.jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--rerun", action="store_true", help="Run every job even if the summary lists it as done")
+    args = parser.parse_args()
+
+    # Workers change to the backend directory, so resolve the user's paths first
+    source = os.path.abspath(args.source)
+    output_dir = os.path.abspath(args.output_dir)
+    summary_path = os.path.abspath(args.summary or os.path.join(output_dir, "summary.jsonl"))
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = directory_jobs(source) if os.path.isdir(source) else manifest_jobs(source)
+    done = set() if args.rerun else completed_jobs(summary_path)
+    pending = [job for job in jobs if job["id"] not in done]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already done, running {len(pending)} on {args.workers} workers")
+
+    # Pool workers leave with os._exit and skip pdf_handle's exit cleanup, so unless UPLOAD_DIR is
+    # set they share one scratch directory that is removed here once the pool has shut down
+    scratch = None
+    if not os.getenv("UPLOAD_DIR"):
+        scratch = tempfile.TemporaryDirectory(prefix="real_estate_batch_")
+        os.environ["UPLOAD_DIR"] = scratch.name
+
+    failed = 0
+    start = time.perf_counter()
+    try:
+        with open(summary_path, "a") as summary, ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+            futures = [pool.submit(run_job, job, output_dir) for job in pending]
+            for finished, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                summary.write(json.dumps(result) + "\n")
+                summary.flush()
+                if result["status"] != "done":
+                    failed += 1
+                elapsed = time.perf_counter() - start
+                detail = f"{result['seconds']:.1f}s" if result["status"] == "done" else result["error"]
+                print(f"[{finished}/{len(pending)}] {result['id']}: {result['status']} ({detail}), "
+                      f"{finished / elapsed:.2f} jobs/sec")
+    finally:
+        if scratch:
+            scratch.cleanup()
+
+    print(f"Finished {len(pending) - failed} jobs, {failed} failed. Summary in {summary_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+Benchmark the report pipeline hot paths.
+
+Run from the backend directory:
+    python bench.py                      # run and compare against bench_baseline.json
+    python bench.py --save-baseline      # run and store the results as the new baseline
+
+Stages:
+    extract   extract_property_info over every PDF in inputs/
+    charts    generate_graphs on the combined residential comparison set, drawn from scratch and
+              again from the chart cache as charts[cached]
+    build     render_report for the same data, optimized and again as build[unoptimized], with the size of each PDF
+    serialize report_data tables plus JSON rendering, with the comparison set scaled to --serialize-rows
+    e2e       upload + /generate-report through the ASGI test client with auth stubbed
+
+Each stage reports wall time per iteration, throughput and the peak RSS of the process so
+far. A stage whose time per iteration is more than --threshold slower than the baseline
+fails the run with exit code 1.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUTS_DIR = os.path.join(BACKEND_DIR, "..", "inputs")
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "bench_baseline.json")
+
+# Import the app from the backend directory so reports/ and temp files land in the usual places
+os.chdir(BACKEND_DIR)
+import pdf_handle
+import pdf_text
+from middleware import verify_token
+from reportlab import rl_config
+from report_render import render_report
+from chart_cache import ChartCache
+from responses import FastJSONResponse, dataframe_payload
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024
+    return rss / 1024
+
+def input_pdfs():
+    return sorted(
+        os.path.join(INPUTS_DIR, name) for name in os.listdir(INPUTS_DIR) if name.lower().endswith(".pdf")
+    )
+
+def page_count(path):
+    return pdf_text.page_count(path)
+
+def stage_result(name, elapsed, iterations, units, unit_name):
+    return {
+        "stage": name,
+        "seconds": elapsed,
+        "seconds_per_iteration": elapsed / iterations,
+        "iterations": iterations,
+        "throughput": units / elapsed if elapsed else 0.0,
+        "throughput_unit": unit_name,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def residential_set(paths):
+    """Split the sample PDFs into a residential subject and its comparisons"""
+    residential = [path for path in paths if pdf_handle.extract_property_type(path) == "Residential"]
+    if len(residential) < 2:
+        raise SystemExit("Need at least two residential PDFs in inputs/ to benchmark reports")
+    return residential[0], residential[1:]
+
+def combined_frames(subject, comps):
+    import pandas as pd
+    property_rows, price_rows = [], []
+    for path in [subject] + comps:
+        property_info, price_info, features_info, is_rental = pdf_handle.extract_property_info(path)
+        property_rows.extend(property_info)
+        price_rows.extend(price_info)
+    return pd.DataFrame(property_rows), pd.DataFrame(price_rows)
+
+def bench_extract(paths, iterations):
+    pages = sum(page_count(path) for path in paths) * iterations
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for path in paths:
+            pdf_handle.extract_property_info(path)
+    return stage_result("extract", time.perf_counter() - start, iterations, pages, "pages/sec")
+
+def bench_charts(price_df, iterations):
+    # A private cache without the shared directory, cleared so every timed iteration really draws
+    pdf_handle.chart_cache = ChartCache(directory=None)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pdf_handle.chart_cache.clear()
+        pdf_handle.generate_graphs(price_df, False)
+    results = [stage_result("charts", time.perf_counter() - start, iterations, iterations, "chart sets/sec")]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pdf_handle.generate_graphs(price_df, False)
+    results.append(stage_result("charts[cached]", time.perf_counter() - start, iterations, iterations, "chart sets/sec"))
+    return results
+
+def bench_build(property_df, price_df, iterations):
+    input_sq_ft = property_df['Living Sq Ft'].iloc[0]
+    appraisal_report = pdf_handle.generate_appraisal_report(price_df.copy(), input_sq_ft, False)
+    output_path = os.path.join(tempfile.gettempdir(), "bench_property_comparison.pdf")
+    results = []
+    # The optimized report and the plain ReportLab output, to show what the optimization saves
+    use_a85 = rl_config.useA85
+    for stage, optimize in (("build", True), ("build[unoptimized]", False)):
+        # The server sets ASCII85 once from REPORT_OPTIMIZE, the bench renders one report at a time so it can switch it
+        rl_config.useA85 = 0 if optimize else 1
+        start = time.perf_counter()
+        for _ in range(iterations):
+            render_report(output_path, property_df, price_df, appraisal_report,
+                          os.path.join(pdf_handle.temp_dir, 'list_price_vs_sold_price.png'),
+                          os.path.join(pdf_handle.temp_dir, 'list_price_sqft_vs_sold_price_sqft.png'),
+                          optimize=optimize)
+        elapsed = time.perf_counter() - start
+        result = stage_result(stage, elapsed, iterations, iterations, "reports/sec")
+        result["pdf_bytes"] = os.path.getsize(output_path)
+        results.append(result)
+        os.remove(output_path)
+    rl_config.useA85 = use_a85
+    optimized, unoptimized = results[0]["pdf_bytes"], results[1]["pdf_bytes"]
+    print(f"Report size: {unoptimized / 1024:.1f} KB unoptimized -> {optimized / 1024:.1f} KB optimized "
+          f"({1 - optimized / unoptimized:.0%} smaller)")
+    return results
+
+def bench_serialize(property_df, price_df, iterations, rows):
+    import pandas as pd
+    repeats = max(1, rows // len(property_df))
+    large_property_df = pd.concat([property_df] * repeats, ignore_index=True)
+    large_price_df = pd.concat([price_df] * repeats, ignore_index=True)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        FastJSONResponse({
+            "property_comparison": dataframe_payload(large_property_df),
+            "price_analysis": dataframe_payload(large_price_df)
+        })
+    return stage_result("serialize", time.perf_counter() - start, iterations, len(large_property_df) * iterations, "rows/sec")
+
+def bench_e2e(subject, comps, iterations):
+    from fastapi.testclient import TestClient
+    pdf_handle.app.dependency_overrides[verify_token] = lambda: "bench"
+    client = TestClient(pdf_handle.app)
+    report_ids = []
+    start = time.perf_counter()
+    try:
+        for _ in range(iterations):
+            with open(subject, "rb") as file:
+                response = client.post("/upload-input-pdf", files={"file": (os.path.basename(subject), file, "application/pdf")})
+            response.raise_for_status()
+            input_id = response.json()["file_id"]
+            handles = [open(path, "rb") for path in comps]
+            try:
+                response = client.post("/upload-comparison-pdf", files=[
+                    ("files", (os.path.basename(path), handle, "application/pdf")) for path, handle in zip(comps, handles)
+                ])
+            finally:
+                for handle in handles:
+                    handle.close()
+            response.raise_for_status()
+            comp_ids = [uploaded["file_id"] for uploaded in response.json()["uploaded_files"]]
+            response = client.get("/generate-report", params={"input_file": input_id, "comparison_files": ",".join(comp_ids)})
+            response.raise_for_status()
+            report_ids.append(response.json()["report_id"])
+        elapsed = time.perf_counter() - start
+    finally:
+        pdf_handle.app.dependency_overrides.pop(verify_token, None)
+        for report_id in report_ids:
+            report_path = os.path.join(pdf_handle.reports_dir, f"{report_id}.pdf")
+            if os.path.exists(report_path):
+                os.remove(report_path)
+    return stage_result("e2e", elapsed, iterations, iterations, "reports/sec")
+
+def compare(results, baseline, threshold):
+    """Return the stages that regressed past the threshold"""
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["stage"])
+        if not previous:
+            continue
+        limit = previous["seconds_per_iteration"] * (1 + threshold)
+        if result["seconds_per_iteration"] > limit:
+            regressions.append((result["stage"], previous["seconds_per_iteration"], result["seconds_per_iteration"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extraction, charting, PDF build and end-to-end report generation")
+    parser.add_argument("--iterations", type=int, default=3, help="Iterations per stage")
+    parser.add_argument("--stages", default="extract,charts,build,serialize,e2e", help="Comma-separated stages to run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown per stage before failing, 0.2 = 20%%")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--serialize-rows", type=int, default=1000, help="Comparison set size for the serialize stage")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    paths = input_pdfs()
+    subject, comps = residential_set(paths)
+    property_df, price_df = combined_frames(subject, comps)
+
+    results = []
+    if "extract" in stages:
+        results.append(bench_extract(paths, args.iterations))
+    if "charts" in stages or "build" in stages:
+        # The build stage embeds the charts, so they have to exist even when charts is skipped
+        chart_results = bench_charts(price_df.copy(), args.iterations)
+        if "charts" in stages:
+            results.extend(chart_results)
+    if "build" in stages:
+        results.extend(bench_build(property_df, price_df, args.iterations))
+    if "serialize" in stages:
+        results.append(bench_serialize(property_df, price_df, args.iterations, args.serialize_rows))
+    if "e2e" in stages:
+        results.append(bench_e2e(subject, comps, args.iterations))
+
+    print(f"{'stage':<18}{'s/iter':>10}{'throughput':>14}  {'unit':<16}{'peak RSS MB':>12}")
+    for result in results:
+        print(f"{result['stage']:<18}{result['seconds_per_iteration']:>10.3f}{result['throughput']:>14.2f}  "
+              f"{result['throughput_unit']:<16}{result['peak_rss_mb']:>12.1f}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({result["stage"]: result for result in results}, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        # Passing without a baseline would make the regression gate a no-op
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 1
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.threshold)
+    for stage, previous, current in regressions:
+        print(f"REGRESSION {stage}: {previous:.3f}s -> {current:.3f}s per iteration")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
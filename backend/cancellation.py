@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Seconds each report stage may run before the job is cancelled at its next checkpoint, 0 disables
+STAGE_DEADLINES = {
+    "parse": float(os.getenv("PARSE_DEADLINE_SECONDS", "120")),
+    "chart": float(os.getenv("CHART_DEADLINE_SECONDS", "60")),
+    "build": float(os.getenv("BUILD_DEADLINE_SECONDS", "120")),
+    "llm": float(os.getenv("LLM_DEADLINE_SECONDS", "60")),
+}
+# How often a report endpoint checks whether its client is still connected
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint once the client has gone away or the current stage is past its deadline"""
+
+    def __init__(self, reason, stage=None):
+        super().__init__(f"{reason} during {stage}" if stage else reason)
+        self.reason = reason
+        self.stage = stage
+
+class CancelToken:
+    """
+    Shared between a report endpoint and the worker thread building the report.
+
+    The endpoint calls cancel() when the client disconnects; the worker calls check() between
+    units of work and runs each stage inside stage() so its deadline applies.
+    """
+
+    def __init__(self, deadlines=None):
+        self.deadlines = STAGE_DEADLINES if deadlines is None else deadlines
+        self.reason = None
+        self.stage_name = None
+        self.stage_deadline = None
+        self._event = threading.Event()
+
+    def cancel(self, reason):
+        if self.reason is None:
+            self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self, *args):
+        """Raise JobCancelled if the job should stop. Extra arguments are ignored so it can be passed as a callback"""
+        if self.stage_deadline is not None and time.monotonic() > self.stage_deadline:
+            self.cancel("deadline")
+        if self._event.is_set():
+            metrics.JOBS_CANCELLED.inc(reason=self.reason, stage=self.stage_name or "none")
+            raise JobCancelled(self.reason, self.stage_name)
+
+    def remaining(self):
+        """Seconds left before the current stage's deadline, None when it has none"""
+        if self.stage_deadline is None:
+            return None
+        return max(0.0, self.stage_deadline - time.monotonic())
+
+    @contextmanager
+    def stage(self, name):
+        self.check()
+        limit = self.deadlines.get(name, 0)
+        self.stage_name = name
+        self.stage_deadline = time.monotonic() + limit if limit > 0 else None
+        try:
+            yield self
+            # A stage without checkpoints of its own is still held to its deadline once it returns
+            self.check()
+        finally:
+            self.stage_deadline = None
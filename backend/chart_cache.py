@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# Rendered chart PNGs keyed by a hash of everything that is drawn: the chart type, the plotted
+# labels and values, and the style and DPI. Reports whose comparables plot the same numbers
+# (identical regenerations, manual reports that only change text fields) reuse the bytes
+# instead of running matplotlib again.
+# Memory budget of the per-process LRU, 0 disables the cache
+CHART_CACHE_MB = float(os.getenv("CHART_CACHE_MB", "64"))
+# Optional directory shared by every worker, e.g. on the UPLOAD_DIR volume. Unset keeps the cache per process
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR")
+# Size the shared directory is pruned back to, least recently used files first
+CHART_CACHE_DIR_MB = float(os.getenv("CHART_CACHE_DIR_MB", "512"))
+# Bump when the drawing code changes so charts cached on disk by an older version are not reused
+CHART_STYLE_VERSION = 1
+
+def chart_key(spec):
+    """Hash of a chart spec, which must hold every input of the drawing code"""
+    payload = json.dumps([CHART_STYLE_VERSION, spec], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ChartCache:
+    """Bounded LRU of PNG bytes, backed by an optional directory shared between workers"""
+
+    def __init__(self, max_bytes=int(CHART_CACHE_MB * 1024 * 1024), directory=CHART_CACHE_DIR,
+                 max_dir_bytes=int(CHART_CACHE_DIR_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_dir_bytes = max_dir_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is None and self.directory:
+            try:
+                with open(self._path(key), "rb") as file:
+                    data = file.read()
+                # Mark it recently used for pruning
+                os.utime(self._path(key))
+            except OSError:
+                data = None
+            if data is not None:
+                self._remember(key, data)
+        metrics.record_cache_lookup("charts", data is not None)
+        return data
+
+    def put(self, key, data):
+        self._remember(key, data)
+        if self.directory:
+            try:
+                # Written under a temporary name so another worker never reads half a file
+                tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as file:
+                    file.write(data)
+                os.replace(tmp_path, self._path(key))
+                self.prune_directory()
+            except OSError as e:
+                print(f"Error writing chart cache file: {e}")
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def prune_directory(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".png"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_dir_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Drop the in-memory entries, files in the shared directory are left for the other workers"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
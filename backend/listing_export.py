@@ -0,0 +1,283 @@
+"""
+Bulk export of parsed listings as Parquet, Arrow IPC or CSV.
+
+Listings come from the typed rows every parse saves in the state store (or straight from a
+folder of PDFs with --pdfs) and are written batch by batch, so memory stays flat however many listings there
+are. Parquet and Arrow need pyarrow installed, CSV does not.
+
+Run from the backend directory:
+    STATE_BACKEND=sqlite STATE_DB_PATH=state.sqlite3 python listing_export.py --format parquet --output listings.parquet
+    python listing_export.py --pdfs ../inputs --format csv --output listings.csv --status Sold
+"""
+import argparse
+import csv
+import io
+import math
+import os
+import re
+import sys
+
+from state_store import StateNamespace
+
+# Listings converted and written per batch
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Export column, extracted record it comes from, field in that record, column type
+LISTING_COLUMNS = [
+    ("address", "property", "Address", "string"),
+    ("status", "property", "Status", "string"),
+    ("subdivision", "property", "Subdivision", "string"),
+    ("year_built", "property", "Year Built", "int"),
+    ("living_sqft", "property", "Living Sq Ft", "int"),
+    ("total_sqft", "property", "Total Sq Ft", "int"),
+    ("bedrooms", "property", "Bedrooms", "int"),
+    ("full_bathrooms", "property", "Bathrooms (Full)", "int"),
+    ("stories", "property", "Stories", "string"),
+    ("garage_spaces", "property", "Garage Spaces", "int"),
+    ("private_pool", "property", "Private Pool", "string"),
+    ("list_price", "price", "List Price", "float"),
+    ("list_price_per_sqft", "price", "List $/Sq Ft (Living)", "float"),
+    ("sold_price", "price", "Sold Price", "float"),
+    ("sold_price_per_sqft", "price", "Sold $/Sq Ft (Living)", "float"),
+    ("days_on_market", "price", "DOM", "int"),
+    ("is_rental", None, None, "bool"),
+    ("source_sha256", None, None, "string"),
+]
+COLUMN_NAMES = [name for name, _, _, _ in LISTING_COLUMNS]
+
+# Format name: (media type, file extension)
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows"),
+    "csv": ("text/csv", ".csv"),
+}
+
+def _number(value):
+    if value is None:
+        return None
+    try:
+        number = float(str(value).replace('$', '').replace(',', '').strip())
+    except ValueError:
+        return None
+    return None if math.isnan(number) else number
+
+def _convert(value, kind):
+    if kind == "string":
+        return None if value is None else str(value)
+    number = _number(value)
+    if kind == "int" and number is not None:
+        return int(number)
+    return number
+
+def listing_row(property_info, price_info, is_rental, source_sha256):
+    """One typed export row from an extracted property and price record"""
+    records = {"property": property_info, "price": price_info}
+    row = {}
+    for name, source, field, kind in LISTING_COLUMNS:
+        if source:
+            row[name] = _convert(records[source].get(field), kind)
+    row["is_rental"] = bool(is_rental)
+    row["source_sha256"] = source_sha256
+    return row
+
+def listing_identity(row, fallback):
+    """
+    Key of one listing, the same whichever PDF it was parsed from.
+
+    Args:
+        row (dict): Typed listing row, see listing_row
+        fallback (str): Used instead of the address when the listing has none, e.g. the PDF hash and row index
+    """
+    address = " ".join(re.findall(r"[a-z0-9]+", (row["address"] or "").lower())) or fallback
+    status = (row["status"] or "").strip().lower()
+    return "|".join([address, status, str(row["list_price"]), str(row["sold_price"]), "rental" if row["is_rental"] else "sale"])
+
+def result_rows(source_key, result):
+    """(listing_identity, typed row) for each listing of one extract_property_info result"""
+    property_rows, price_rows, features_rows, is_rental = result
+    for index, (property_info, price_info) in enumerate(zip(property_rows, price_rows)):
+        row = listing_row(property_info, price_info, is_rental, source_key)
+        yield listing_identity(row, f"{source_key}:{index}"), row
+
+class ListingArchive:
+    """
+    Typed rows of every listing parsed so far, kept in a state store by listing_identity.
+
+    Parse results are removed with their uploads once a report is built, these rows stay for the export.
+    """
+
+    def __init__(self, store):
+        self.rows = StateNamespace(store, "listings")
+
+    def record(self, source_key, result):
+        for identity, row in result_rows(source_key, result):
+            self.rows[identity] = row
+
+    def iter_batches(self, batch_size=EXPORT_BATCH_SIZE):
+        return self.rows.iter_batches(batch_size)
+
+def _matches(row, status, subdivision, rental):
+    if status and (row["status"] or "").lower() != status.lower():
+        return False
+    if subdivision and (row["subdivision"] or "").lower() != subdivision.lower():
+        return False
+    return rental is None or row["is_rental"] == rental
+
+def listing_batches(row_batches, status=None, subdivision=None, rental=None):
+    """
+    Filter batches of (listing_identity, typed row) pairs down to batches of rows.
+
+    Args:
+        row_batches: Iterable of lists, as returned by ListingArchive.iter_batches
+        status, subdivision, rental: Optional filters, status and subdivision ignore case
+    """
+    for batch in row_batches:
+        rows = [row for _, row in batch if _matches(row, status, subdivision, rental)]
+        if rows:
+            yield rows
+
+class StreamSink:
+    """Write-only file object that hands back what was written since the last drain()"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # pyarrow asks for the position to record column chunk offsets in the Parquet footer
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def arrow_schema():
+    import pyarrow as pa
+    types = {"string": pa.string(), "int": pa.int64(), "float": pa.float64(), "bool": pa.bool_()}
+    return pa.schema([(name, types[kind]) for name, _, _, kind in LISTING_COLUMNS])
+
+def stream_arrow(batches, file_format):
+    """Yield Parquet (one row group per batch) or Arrow IPC stream bytes"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = arrow_schema()
+    sink = StreamSink()
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for rows in batches:
+        record_batch = pa.RecordBatch.from_pylist(rows, schema=schema)
+        if file_format == "parquet":
+            writer.write_table(pa.Table.from_batches([record_batch]))
+        else:
+            writer.write_batch(record_batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+def stream_csv(batches):
+    """Yield CSV bytes, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMN_NAMES)
+    for rows in batches:
+        writer.writerows([["" if row[name] is None else row[name] for name in COLUMN_NAMES] for row in rows])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # No listings matched, still send the header
+        yield buffer.getvalue().encode()
+
+def stream_listings(batches, file_format):
+    if file_format == "csv":
+        return stream_csv(batches)
+    return stream_arrow(batches, file_format)
+
+def pyarrow_available():
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        return False
+
+def pdf_dir_rows(directory, batch_size=EXPORT_BATCH_SIZE):
+    """Extract every PDF in a directory, in the same batches ListingArchive yields"""
+    import pdf_handle
+    batch = []
+    seen = set()
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        path = os.path.join(directory, name)
+        result = pdf_handle.extract_property_info(path)
+        if result is None:
+            continue
+        for identity, row in result_rows(pdf_handle.file_sha256(path), result):
+            # A listing exported in several PDFs is written once, as it is from the state store
+            if identity not in seen:
+                seen.add(identity)
+                batch.append((identity, row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def main():
+    parser = argparse.ArgumentParser(description="Export parsed listings as Parquet, Arrow IPC or CSV")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("--output", required=True, help="File to write")
+    parser.add_argument("--pdfs", help="Extract the PDFs in this directory instead of reading the state store")
+    parser.add_argument("--status", help="Only listings with this status, e.g. Sold")
+    parser.add_argument("--subdivision", help="Only listings in this subdivision")
+    parser.add_argument("--rental", choices=["yes", "no"], help="Only rental or only sale listings")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.format != "csv" and not pyarrow_available():
+        print(f"{args.format} export needs pyarrow, pip install pyarrow or use --format csv")
+        return 1
+    if args.pdfs:
+        row_batches = pdf_dir_rows(args.pdfs, args.batch_size)
+    else:
+        from state_store import STATE_BACKEND, create_state_store
+        if STATE_BACKEND == "memory":
+            # A new in-memory store is always empty, the server's listings are only reachable through a shared one
+            print("Reading the state store needs STATE_BACKEND=sqlite and the server's STATE_DB_PATH, or pass --pdfs")
+            return 1
+        row_batches = ListingArchive(create_state_store()).iter_batches(args.batch_size)
+    rental = None if args.rental is None else args.rental == "yes"
+    batches = listing_batches(row_batches, args.status, args.subdivision, rental)
+    written = 0
+    with open(args.output, "wb") as file:
+        for chunk in stream_listings(batches, args.format):
+            file.write(chunk)
+            written += len(chunk)
+    print(f"Wrote {written} bytes to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
-import openai
 import os
 import dotenv
-import pandas as pd
+from metrics import timed
+from cancellation import CancelToken
 dotenv.load_dotenv()
 
 # Call chatgpt through an api
@@ -46,6 +46,7 @@ def generate_chatgpt_prompt_features(features_info):
     return prompt
 
 # Calling chatgpt for feature comparisons
+@timed("llm_feature_list")
 def get_feature_list(prompt):
     # openai.api_key = os.getenv("OPENAI_API_KEY")
     # response = openai.ChatCompletion.create(
@@ -54,6 +55,7 @@ def get_feature_list(prompt):
     # )
     # chatgpt_message = response.choices[0].message.content["content"]
     # print("Chatgpt message: ", chatgpt_message)
+    import pandas as pd
     chatgpt_message = prompt
     # Convert to dataframe
     feature_list = chatgpt_message.split("|")
@@ -79,24 +81,32 @@ def get_feature_list(prompt):
     
 
 # Calling chatgpt mini with prompt
-def call_chatgpt_mini(prompt):
+@timed("llm_chat_completion")
+def call_chatgpt_mini(prompt, timeout=None):
+    # Imported here so the openai client does not slow down app startup
+    import openai
     openai.api_key = os.getenv("OPENAI_API_KEY")
     response = openai.ChatCompletion.create(
         model="gpt-5-mini",
         messages=[{"role": "user", "content": prompt}],
+        request_timeout=timeout,
     )
     chatgpt_message = response.choices[0].message.content["content"]
     return chatgpt_message
 
 # Main function that will be called when the api is called in the backend
-def get_chatgpt_response(property_info, price_info, feature_info):
+def get_chatgpt_response(property_info, price_info, feature_info, cancel=None):
 # Calling chatgpt mini for main response
-    feature_prompt = generate_chatgpt_prompt_features(feature_info)
-    # Will be a dataframe with the features
-    feature_df = get_feature_list(feature_prompt)
-    # Get the overall prompt
-    mini_prompt = generate_chatgpt_prompt_mini(property_info, price_info, feature_df)
-    
-    chat_response = call_chatgpt_mini(mini_prompt)
+    # The llm stage deadline also bounds the request timeout, so a slow completion cannot outlive it
+    cancel = cancel or CancelToken()
+    with cancel.stage("llm"):
+        feature_prompt = generate_chatgpt_prompt_features(feature_info)
+        # Will be a dataframe with the features
+        feature_df = get_feature_list(feature_prompt)
+        # Get the overall prompt
+        mini_prompt = generate_chatgpt_prompt_mini(property_info, price_info, feature_df)
+        cancel.check()
+
+        chat_response = call_chatgpt_mini(mini_prompt, timeout=cancel.remaining())
     # Call chatgpt
     return chat_response
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Offline load test for the report API.
+
+Starts the FastAPI app with a local JWKS server (self-signed RS256 key) standing in for Cognito,
+then drives upload -> generate-report -> download flows with the PDFs in inputs/.
+No endpoint in these flows calls OpenAI, so no LLM stand-in is needed.
+
+Run from the backend directory:
+    python loadtest.py --concurrency 8 --flows 40
+
+Reports throughput, latency percentiles per step and error rates.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUTS_DIR = os.path.join(BACKEND_DIR, "..", "inputs")
+KEY_ID = "loadtest-key"
+
+class JWKSHandler(BaseHTTPRequestHandler):
+    jwks = {"keys": []}
+
+    def do_GET(self):
+        body = json.dumps(self.jwks).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_signing_key():
+    """Generate an RS256 key pair and the JWKS document that publishes its public half"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": KEY_ID, "alg": "RS256", "use": "sig"})
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    return private_pem, {"keys": [jwk]}
+
+def make_token(private_pem, user):
+    now = int(time.time())
+    claims = {"sub": user, "username": user, "token_use": "access", "iat": now, "exp": now + 3600}
+    return jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": KEY_ID})
+
+def start_app(port):
+    """Run the API in a background thread once the stand-in servers are configured"""
+    import uvicorn
+    os.chdir(BACKEND_DIR)
+    import pdf_handle
+    config = uvicorn.Config(pdf_handle.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, pdf_handle
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_flow(client, token, subject, comps, latencies, errors):
+    """Upload a subject and its comparisons, generate the report and download it"""
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def step(name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+            response.raise_for_status()
+            return response
+        except Exception as e:
+            errors[name].append(str(e))
+            raise
+        finally:
+            latencies[name].append(time.perf_counter() - start)
+
+    with open(subject, "rb") as file:
+        subject_bytes = file.read()
+    response = await step("upload_input", "POST", "/upload-input-pdf",
+                          files={"file": (os.path.basename(subject), subject_bytes, "application/pdf")})
+    input_id = response.json()["file_id"]
+
+    comp_files = []
+    for path in comps:
+        with open(path, "rb") as file:
+            comp_files.append(("files", (os.path.basename(path), file.read(), "application/pdf")))
+    response = await step("upload_comparisons", "POST", "/upload-comparison-pdf", files=comp_files)
+    comp_ids = [uploaded["file_id"] for uploaded in response.json()["uploaded_files"]]
+
+    response = await step("generate_report", "GET", "/generate-report",
+                          params={"input_file": input_id, "comparison_files": ",".join(comp_ids)})
+    report_id = response.json()["report_id"]
+
+    await step("download_report", "GET", f"/download-report/{report_id}")
+    return report_id
+
+async def drive(base_url, tokens, subject, comps, flows, concurrency):
+    import httpx
+    latencies = defaultdict(list)
+    errors = defaultdict(list)
+    flow_latencies = []
+    failed_flows = 0
+    report_ids = []
+    queue = asyncio.Queue()
+    for i in range(flows):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        async def worker(worker_id):
+            nonlocal failed_flows
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    report_ids.append(await run_flow(client, tokens[worker_id], subject, comps, latencies, errors))
+                    flow_latencies.append(time.perf_counter() - start)
+                except Exception:
+                    failed_flows += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors, flow_latencies, failed_flows, report_ids
+
+def residential_set(pdf_handle):
+    paths = sorted(os.path.join(INPUTS_DIR, name) for name in os.listdir(INPUTS_DIR) if name.lower().endswith(".pdf"))
+    residential = [path for path in paths if pdf_handle.extract_property_type(path) == "Residential"]
+    if len(residential) < 2:
+        raise SystemExit("Need at least two residential PDFs in inputs/ to load test reports")
+    return residential[0], residential[1:]
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the report API against a local JWKS stand-in")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent virtual users")
+    parser.add_argument("--flows", type=int, default=20, help="Total upload -> report -> download flows")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the API under test")
+    parser.add_argument("--output", help="Also write the summary to this JSON file")
+    parser.add_argument("--keep-reports", action="store_true", help="Keep generated reports in reports/")
+    args = parser.parse_args()
+
+    private_pem, jwks = make_signing_key()
+    JWKSHandler.jwks = jwks
+    jwks_server = start_http_server(JWKSHandler)
+    # verify_token fetches the signing keys from this URL on every request
+    os.environ["AWS_SIGNING_KEY_URL"] = f"http://127.0.0.1:{jwks_server.server_port}/.well-known/jwks.json"
+
+    server, pdf_handle = start_app(args.port)
+    subject, comps = residential_set(pdf_handle)
+    tokens = [make_token(private_pem, f"loadtest-user-{i}") for i in range(args.concurrency)]
+
+    elapsed, latencies, errors, flow_latencies, failed_flows, report_ids = asyncio.run(
+        drive(f"http://127.0.0.1:{args.port}", tokens, subject, comps, args.flows, args.concurrency)
+    )
+    server.should_exit = True
+    jwks_server.shutdown()
+    if not args.keep_reports:
+        for report_id in report_ids:
+            report_path = os.path.join(pdf_handle.reports_dir, f"{report_id}.pdf")
+            if os.path.exists(report_path):
+                os.remove(report_path)
+
+    requests_sent = sum(len(values) for values in latencies.values())
+    request_errors = sum(len(values) for values in errors.values())
+    summary = {
+        "concurrency": args.concurrency,
+        "flows": args.flows,
+        "seconds": elapsed,
+        "flows_per_sec": len(flow_latencies) / elapsed if elapsed else 0.0,
+        "requests_per_sec": requests_sent / elapsed if elapsed else 0.0,
+        "flow_error_rate": failed_flows / args.flows if args.flows else 0.0,
+        "request_error_rate": request_errors / requests_sent if requests_sent else 0.0,
+        "steps": {},
+    }
+    for name, values in list(latencies.items()) + [("flow", flow_latencies)]:
+        summary["steps"][name] = {
+            "count": len(values),
+            "errors": len(errors.get(name, [])),
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0,
+        }
+
+    print(f"{args.flows} flows at concurrency {args.concurrency} in {elapsed:.2f}s")
+    print(f"throughput: {summary['flows_per_sec']:.2f} flows/sec, {summary['requests_per_sec']:.2f} requests/sec")
+    print(f"errors: {summary['flow_error_rate']:.1%} of flows, {summary['request_error_rate']:.1%} of requests")
+    print(f"{'step':<20}{'count':>7}{'errors':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for name, step in summary["steps"].items():
+        print(f"{name:<20}{step['count']:>7}{step['errors']:>8}{step['p50']:>9.3f}{step['p90']:>9.3f}{step['p99']:>9.3f}{step['max']:>9.3f}")
+    for name, messages in errors.items():
+        print(f"first {name} error: {messages[0]}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=2)
+    return 1 if failed_flows else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import math
+
+from listing_export import result_rows
+from state_store import StateNamespace
+
+# Running market statistics per subdivision and status, updated once per parsed listing so a
+# lookup never rescans listings. Every record is plain JSON so it works with either state store,
+# and each update goes through the store's atomic update so concurrent workers don't lose counts.
+
+# Upper bounds of the days-on-market histogram buckets, the last bucket is open ended
+DOM_BUCKETS = (7, 14, 30, 60, 90, 180)
+ALL_STATUSES = "*"
+
+def new_running_mean():
+    return {"n": 0, "mean": 0.0, "m2": 0.0}
+
+def add_running_mean(state, value):
+    """Welford's online mean and variance"""
+    state["n"] += 1
+    delta = value - state["mean"]
+    state["mean"] += delta / state["n"]
+    state["m2"] += delta * (value - state["mean"])
+
+def new_median_sketch():
+    return {"initial": [], "heights": [], "positions": [], "desired": []}
+
+def add_median_sketch(sketch, value, p=0.5):
+    """P-square streaming quantile estimate (Jain and Chlamtac), five markers instead of every value"""
+    if len(sketch["initial"]) < 5:
+        sketch["initial"].append(value)
+        if len(sketch["initial"]) == 5:
+            sketch["heights"] = sorted(sketch["initial"])
+            sketch["positions"] = [1, 2, 3, 4, 5]
+            sketch["desired"] = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        return
+    q, n, desired = sketch["heights"], sketch["positions"], sketch["desired"]
+    increments = (0, p / 2, p, (1 + p) / 2, 1)
+    # Find the cell the value falls in, stretching the extremes if needed
+    if value < q[0]:
+        q[0] = value
+        k = 0
+    elif value >= q[4]:
+        q[4] = value
+        k = 3
+    else:
+        k = next(i for i in range(4) if q[i] <= value < q[i + 1])
+    for i in range(k + 1, 5):
+        n[i] += 1
+    for i in range(5):
+        desired[i] += increments[i]
+    # Move the middle markers towards their desired positions
+    for i in range(1, 4):
+        offset = desired[i] - n[i]
+        if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+            d = 1 if offset > 0 else -1
+            parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+            )
+            if q[i - 1] < parabolic < q[i + 1]:
+                q[i] = parabolic
+            else:
+                q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+            n[i] += d
+
+def sketch_median(sketch):
+    if len(sketch["initial"]) < 5:
+        values = sorted(sketch["initial"])
+        if not values:
+            return None
+        middle = len(values) // 2
+        return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+    return sketch["heights"][2]
+
+def new_stats(subdivision, status, rental):
+    return {
+        "subdivision": subdivision,
+        "status": status,
+        "rental": rental,
+        "count": 0,
+        "list_price_per_sqft": {"mean": new_running_mean(), "median": new_median_sketch()},
+        "sold_price_per_sqft": {"mean": new_running_mean(), "median": new_median_sketch()},
+        "sold_to_list_ratio": new_running_mean(),
+        "days_on_market": new_running_mean(),
+        "dom_histogram": [0] * (len(DOM_BUCKETS) + 1),
+    }
+
+def add_listing(stats, row):
+    """Fold one typed listing row (see listing_export.listing_row) into a stats record"""
+    stats["count"] += 1
+    for name in ("list_price_per_sqft", "sold_price_per_sqft"):
+        if row[name] is not None:
+            add_running_mean(stats[name]["mean"], row[name])
+            add_median_sketch(stats[name]["median"], row[name])
+    if row["sold_price"] is not None and row["list_price"]:
+        add_running_mean(stats["sold_to_list_ratio"], row["sold_price"] / row["list_price"])
+    if row["days_on_market"] is not None:
+        add_running_mean(stats["days_on_market"], row["days_on_market"])
+        bucket = next((i for i, bound in enumerate(DOM_BUCKETS) if row["days_on_market"] <= bound), len(DOM_BUCKETS))
+        stats["dom_histogram"][bucket] += 1
+    return stats
+
+def stats_key(subdivision, status, rental):
+    return "|".join([subdivision.strip().lower(), status.strip().lower(), "rental" if rental else "sale"])
+
+def summarize_mean(state):
+    if not state["n"]:
+        return None
+    return {
+        "n": state["n"],
+        "mean": state["mean"],
+        "stdev": math.sqrt(state["m2"] / (state["n"] - 1)) if state["n"] > 1 else 0.0
+    }
+
+def summarize(stats):
+    labels = [f"<={bound}" for bound in DOM_BUCKETS] + [f">{DOM_BUCKETS[-1]}"]
+    summary = {"subdivision": stats["subdivision"], "status": stats["status"], "rental": stats["rental"], "count": stats["count"]}
+    for name in ("list_price_per_sqft", "sold_price_per_sqft"):
+        summary[name] = summarize_mean(stats[name]["mean"])
+        if summary[name]:
+            summary[name]["median"] = sketch_median(stats[name]["median"])
+    summary["sold_to_list_ratio"] = summarize_mean(stats["sold_to_list_ratio"])
+    summary["days_on_market"] = summarize_mean(stats["days_on_market"])
+    summary["dom_histogram"] = dict(zip(labels, stats["dom_histogram"]))
+    return summary
+
+class MarketStats:
+    """Per subdivision and status statistics kept in a state store"""
+
+    def __init__(self, store):
+        self.stats = StateNamespace(store, "market_stats")
+        # Listings already counted (see listing_identity), so a listing that is in several PDFs,
+        # or a PDF uploaded again, is only counted once
+        self.seen = StateNamespace(store, "market_seen")
+
+    def mark_seen(self, identity):
+        """True the first time a listing identity is seen, by any worker"""
+        first_time = []
+
+        def mark(seen):
+            first_time.append(not seen)
+            return True
+
+        self.seen.update_value(identity, mark, False)
+        return first_time[0]
+
+    def record(self, source_key, result):
+        """Add the listings of one extract_property_info result, each listing only once"""
+        for identity, row in result_rows(source_key, result):
+            if not row["subdivision"]:
+                continue
+            if not self.mark_seen(identity):
+                continue
+            status = row["status"] or "Unknown"
+            # The status-specific record plus the all-statuses record, each one O(1) to look up
+            for key_status in (status, ALL_STATUSES):
+                self.stats.update_value(
+                    stats_key(row["subdivision"], key_status, row["is_rental"]),
+                    lambda stats: add_listing(stats or new_stats(row["subdivision"], key_status, row["is_rental"]), row)
+                )
+
+    def lookup(self, subdivision, status=None, rental=False):
+        stats = self.stats.get(stats_key(subdivision, status or ALL_STATUSES, rental))
+        return summarize(stats) if stats else None
+
+    def appraisal_line(self, subdivision, rental=False):
+        """One appraisal bullet with the subdivision's running $/sq ft, None when nothing was parsed there yet"""
+        summary = self.lookup(subdivision, rental=rental) if subdivision else None
+        if not summary:
+            return None
+        name = "list_price_per_sqft" if rental else "sold_price_per_sqft"
+        price_per_sqft = summary[name]
+        if not price_per_sqft:
+            return None
+        line = (f"Across {price_per_sqft['n']} listings parsed in {summary['subdivision']}, the average "
+                f"{'list' if rental else 'sold'} $/sq ft is ${price_per_sqft['mean']:.2f} "
+                f"(median ~ ${price_per_sqft['median']:.2f})")
+        if not rental and summary["sold_to_list_ratio"]:
+            line += f", selling at {summary['sold_to_list_ratio']['mean']:.1%} of list"
+        return line + "."
@@ -0,0 +1,172 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics registry rendered in the Prometheus text exposition format.
+# Values are per process, so scrape every worker when running more than one.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_metrics = []
+_cache_infos = {}
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        with _lock:
+            _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name + _format_labels(self.labelnames, key), value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.values = {}
+        with _lock:
+            _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, (counts, total) in self.values.items():
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + "_bucket" + _format_labels(self.labelnames, key, ("le", _format_value(bound))), count
+            yield self.name + "_count" + _format_labels(self.labelnames, key), counts[-1]
+            yield self.name + "_sum" + _format_labels(self.labelnames, key), total
+
+STAGE_SECONDS = Histogram("report_stage_duration_seconds", "Time spent in each report pipeline stage", ["stage"])
+STAGE_ERRORS = Counter("report_stage_errors_total", "Pipeline stages that raised an exception", ["stage"])
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"])
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled", ["method", "route"])
+STARTUP_SECONDS = Gauge("app_startup_seconds", "Module import, warm-up and first request latency", ["phase"])
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for a build slot", ["queue"])
+ADMISSION_RUNNING = Gauge("admission_running", "Requests holding a build slot", ["queue"])
+ADMISSION_WAIT_SECONDS = Histogram("admission_wait_seconds", "Time spent waiting for a build slot", ["queue"])
+JOBS_CANCELLED = Counter("report_jobs_cancelled_total", "Report jobs stopped by a client disconnect or stage deadline", ["reason", "stage"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Requests turned away by admission control", ["queue", "reason"])
+REPORT_BYTES = Histogram("report_size_bytes", "Size of rendered report PDFs", ["optimized"],
+                         buckets=(50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6, 25e6))
+REPORT_IMAGE_BYTES = Counter("report_image_bytes_total", "Chart image bytes before and after report optimization", ["stage"])
+
+@contextmanager
+def stage_timer(stage):
+    """Time a block of the report pipeline under the given stage label"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+def timed(stage):
+    """Decorator form of stage_timer"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+def register_lru_cache(cache, func):
+    """Report the hit/miss counts of a functools.lru_cache wrapped function under cache_lookups_total"""
+    with _lock:
+        _cache_infos[cache] = func.cache_info
+
+def render():
+    """Render every metric in the Prometheus text format"""
+    lines = []
+    with _lock:
+        cache_values = dict(CACHE_LOOKUPS.values)
+        for cache, cache_info in _cache_infos.items():
+            info = cache_info()
+            cache_values[(cache, "hit")] = cache_values.get((cache, "hit"), 0) + info.hits
+            cache_values[(cache, "miss")] = cache_values.get((cache, "miss"), 0) + info.misses
+        for metric in _metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric is CACHE_LOOKUPS:
+                samples = (
+                    (metric.name + _format_labels(metric.labelnames, key), value) for key, value in cache_values.items()
+                )
+            else:
+                samples = metric.samples()
+            for name, value in samples:
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -1,41 +1,64 @@
-
-import pandas as pd
-import PyPDF2
+import time
+# Measured so startup cost can be reported on /ready and /metrics
+_import_started = time.perf_counter()
 import os
 import re
 import tempfile
+import atexit
 from pathlib import Path
-# Write DataFrames to PDF in minimal lines
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, ListFlowable, ListItem
-import matplotlib.pyplot as plt
-from reportlab.platypus import Image, PageBreak
-from reportlab.pdfbase.pdfmetrics import stringWidth
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Depends, Request
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
+import io
 import uuid
 import shutil
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Optional
+from contextlib import closing
 import json
+import hashlib
+import math
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-from middleware import verify_token, verify_token_query
+from starlette.routing import Match
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from middleware import verify_token
 from llm_api import generate_chatgpt_prompt_mini, generate_chatgpt_prompt_features, get_feature_list
+from upload_stream import read_upload, ZipArchive
+import pdf_text
+import listing_export
+from admission import report_admission
+from cancellation import CancelToken, JobCancelled, DISCONNECT_POLL_INTERVAL
+from market_stats import MarketStats
+from text_similarity import rank_comparables
+from amenity_tagger import AmenityTagger, load_vocabulary
+from signed_urls import ReportUrlSigner
+from chart_cache import ChartCache, chart_key
+from responses import FastJSONResponse, dataframe_payload, DATAFRAME_ORIENTS
+import metrics
+from metrics import timed
+from profiling import ProfilingMiddleware, run_in_threadpool
+from state_store import create_state_store, StateNamespace
+
+# pandas, PyPDF2, matplotlib and ReportLab are imported where they are first used so the
+# app starts quickly. warm_up() loads them ahead of the first request when WARMUP_ON_STARTUP is set.
+def load_pyplot():
+    """Import pyplot with the non-GUI backend pinned"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
 
 def extract_property_type(file_path):
-    with open(file_path, 'rb') as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        for page_num, page in enumerate(pdf_reader.pages):
-            text = page.extract_text()
+    # Only the first page is needed, the page generator stops extracting once it is closed
+    with closing(pdf_text.page_texts(file_path)) as page_texts:
+        for page_num, text in enumerate(page_texts):
             if 'residential customer report' in text.lower():
                 return "Residential"
             else:
                 return "Rental"
 
+@timed("extract_property_info")
 def extract_property_info(file_path):
     """
     Extract property information from PDF text.
@@ -47,19 +70,17 @@ def extract_property_info(file_path):
     Returns:
         dict: Dictionary containing extracted property information
     """
+    import pandas as pd
     rental_report = False
     try:
-        with open(file_path, 'rb') as file:
-            # Create PDF reader object
-            pdf_reader = PyPDF2.PdfReader(file)
+        # Pages are only extracted as the loop consumes them
+        with closing(pdf_text.page_texts(file_path)) as page_texts:
 
             property_result = []
             price_result = []
             features_result = []
             # Loop through each page of the PDF
-            for page_num, page in enumerate(pdf_reader.pages):
-                # Extract text from the page
-                text = page.extract_text()
+            for page_num, text in enumerate(page_texts):
                 # Check if the first line contains residentialcustomer report
                 if 'residential customer report' in text.lower(): 
                     # Initialize dictionaries to store property and price information
@@ -323,7 +344,8 @@ def extract_property_info(file_path):
             return property_result, price_result, features_result, rental_report
     
     except Exception as e:
-        print(f"Error reading PDF file {file_path}: {e}")
+        source = file_path if isinstance(file_path, (str, os.PathLike)) else "held in memory"
+        print(f"Error reading PDF file {source}: {e}")
         return None
 
 def generate_chatgpt_prompt(property_info, price_info, features_info):
@@ -347,201 +369,367 @@ def generate_chatgpt_prompt(property_info, price_info, features_info):
         for key, value in features_info.iloc[idx].items():
             if key != 'Address':
                 prompt += f"{key}: {value} | "
+        amenities = amenity_tagger.tag(features_info.iloc[idx].to_dict())
+        prompt += f"Amenities: {', '.join(amenities) or 'None found'} | "
         prompt += "\n\n"
     prompt += f"Please produce the full appraisal-style comparison for the subject property: {property_info['Address'].iloc[0]} versus the other {len(property_info) - 1} properties. Follow the section structure exactly."
     return prompt
 
 
 
-def generate_graphs(combined_df_price, is_rental):
-    # Clean data by removing None values and converting to numeric
+# Dots per inch of the chart PNGs embedded in the report
+CHART_DPI = 300
+
+def short_address(addr):
+    return addr.split()[0] + ' ' + addr.split()[1] if len(addr.split()) > 1 else addr
+
+def chart_spec(df_clean, filename, series, title, ylabel, figsize):
+    """
+    Everything one comparison bar chart draws, so its hash can key the chart cache.
+
+    Args:
+        series (list): (column, legend label, color) per group of bars
+    """
+    plotted = df_clean.dropna(subset=[column for column, _, _ in series], how='all')
+    if plotted.empty:
+        return None
+    return {
+        "filename": filename,
+        "title": title,
+        "ylabel": ylabel,
+        "figsize": figsize,
+        "dpi": CHART_DPI,
+        "labels": [short_address(addr) for addr in plotted['Address']],
+        "series": [
+            {"label": label, "color": color, "values": [float(value) for value in plotted[column]]}
+            for column, label, color in series
+        ]
+    }
+
+def chart_specs(combined_df_price, is_rental):
+    import pandas as pd
+    df_clean = combined_df_price.copy()
     if is_rental:
-        try:
-            df_clean = combined_df_price.copy()
-            # Convert price columns to numeric, removing $ and commas
-            for col in ['List Price']:
-                df_clean[col] = pd.to_numeric(df_clean[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
-            for col in ['List $/Sq Ft (Living)']:
-                df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-            
-            # Remove rows where both values are None/NaN
-            df_clean = df_clean.dropna(subset=['List Price'])
-            # Filter for properties with both list and sold prices
-            valid_data = df_clean.dropna(subset=['List Price'])
-
-            if not valid_data.empty:
-                addresses = valid_data['Address'].tolist()
-                list_prices = valid_data['List Price'].tolist()
-                
-                x = range(len(addresses))
-                width = 0.35
-            
-                plt.bar([i - width/2 for i in x], list_prices, width, label='List Price', color='skyblue', alpha=0.8)
-                plt.xlabel('Properties')
-                plt.ylabel('Price ($/Month)')
-                plt.title('Rental Price Comparison')
-                plt.xticks(x, [addr.split()[0] + ' ' + addr.split()[1] if len(addr.split()) > 1 else addr for addr in addresses], rotation=45, ha='right')
-                plt.legend()
-                plt.tight_layout()
-                plt.savefig(os.path.join(temp_dir, 'list_price_vs_sold_price.png'), dpi=300, bbox_inches='tight')
-                
-
-            # List $/Sq Ft vs Sold $/Sq Ft Bar Chart
-            plt.figure(figsize=(12, 8))
-
-            valid_sqft_data = df_clean.dropna(subset=['List $/Sq Ft (Living)'])
-            if not valid_sqft_data.empty:
-                addresses_sqft = valid_sqft_data['Address'].tolist()
-                list_sqft = valid_sqft_data['List $/Sq Ft (Living)'].tolist()
-                
-                x_sqft = range(len(addresses_sqft))
-                width = 0.35
-                
-                plt.bar([i - width/2 for i in x_sqft], list_sqft, width, label='List $/Sq Ft', color='lightgreen', alpha=0.8)
-                
-                plt.xlabel('Properties')
-                plt.ylabel('Price per Sq Ft ($)')
-                plt.title('List \$/ Sq Ft Comparison')
-                plt.xticks(x_sqft, [addr.split()[0] + ' ' + addr.split()[1] if len(addr.split()) > 1 else addr for addr in addresses_sqft], rotation=45, ha='right')
-                plt.legend()
-                plt.tight_layout()
-                plt.savefig(os.path.join(temp_dir, 'list_price_sqft_vs_sold_price_sqft.png'), dpi=300, bbox_inches='tight')
-        except Exception as e:
-            print(f"Error generating rental graphs: {e}")
-            return None
+        # Convert price columns to numeric, removing $ and commas
+        df_clean['List Price'] = pd.to_numeric(df_clean['List Price'].str.replace('$', '').str.replace(',', ''), errors='coerce')
+        df_clean['List $/Sq Ft (Living)'] = pd.to_numeric(df_clean['List $/Sq Ft (Living)'], errors='coerce')
+        df_clean = df_clean.dropna(subset=['List Price'])
+        specs = [
+            chart_spec(df_clean, 'list_price_vs_sold_price.png', [('List Price', 'List Price', 'skyblue')],
+                       'Rental Price Comparison', 'Price ($/Month)', (6.4, 4.8)),
+            chart_spec(df_clean, 'list_price_sqft_vs_sold_price_sqft.png',
+                       [('List $/Sq Ft (Living)', 'List $/Sq Ft', 'lightgreen')],
+                       r'List \$/ Sq Ft Comparison', 'Price per Sq Ft ($)', (12, 8))
+        ]
     else:
-        try:
-            df_clean = combined_df_price.copy()
-
-            # Convert price columns to numeric, removing $ and commas
-            for col in ['List Price', 'Sold Price']:
-                df_clean[col] = pd.to_numeric(df_clean[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
+        # Convert price columns to numeric, removing $ and commas
+        for col in ['List Price', 'Sold Price', 'List $/Sq Ft (Living)', 'Sold $/Sq Ft (Living)']:
+            df_clean[col] = pd.to_numeric(df_clean[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
+        # Remove rows where both values are None/NaN
+        df_clean = df_clean.dropna(subset=['List Price', 'Sold Price'], how='all')
+        specs = [
+            chart_spec(df_clean, 'list_price_vs_sold_price.png',
+                       [('List Price', 'List Price', 'skyblue'), ('Sold Price', 'Sold Price', 'lightcoral')],
+                       'List Price vs Sold Price Comparison', 'Price ($ MM)', (6.4, 4.8)),
+            chart_spec(df_clean, 'list_price_sqft_vs_sold_price_sqft.png',
+                       [('List $/Sq Ft (Living)', 'List $/Sq Ft', 'lightgreen'), ('Sold $/Sq Ft (Living)', 'Sold $/Sq Ft', 'orange')],
+                       r'List \$/ Sq Ft vs Sold \$/ Sq Ft Comparison', 'Price per Sq Ft ($)', (12, 8))
+        ]
+    return [spec for spec in specs if spec]
 
-            for col in ['List $/Sq Ft (Living)', 'Sold $/Sq Ft (Living)']:
-                df_clean[col] = pd.to_numeric(df_clean[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
+def render_chart(spec):
+    """Draw one chart spec and return the PNG bytes"""
+    from matplotlib.figure import Figure
+    # A standalone figure, so concurrent reports never draw on pyplot's shared current figure
+    fig = Figure(figsize=spec["figsize"])
+    ax = fig.add_subplot()
+    x = range(len(spec["labels"]))
+    width = 0.35
+    for i, series in enumerate(spec["series"]):
+        ax.bar([pos + (i - 0.5) * width for pos in x], series["values"], width,
+               label=series["label"], color=series["color"], alpha=0.8)
+    ax.set_xlabel('Properties')
+    ax.set_ylabel(spec["ylabel"])
+    ax.set_title(spec["title"])
+    ax.set_xticks(list(x))
+    ax.set_xticklabels(spec["labels"], rotation=45, ha='right')
+    ax.legend()
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=spec["dpi"], bbox_inches='tight')
+    return buffer.getvalue()
 
-            # Remove rows where both values are None/NaN
-            df_clean = df_clean.dropna(subset=['List Price', 'Sold Price'], how='all')
+@timed("generate_graphs")
+def generate_graphs(combined_df_price, is_rental, output_dir=None):
+    """Write the comparison charts to output_dir, reusing the cached PNG of any chart whose data is unchanged"""
+    output_dir = output_dir or temp_dir
+    try:
+        for spec in chart_specs(combined_df_price, is_rental):
+            key = chart_key(spec)
+            data = chart_cache.get(key)
+            if data is None:
+                data = render_chart(spec)
+                chart_cache.put(key, data)
+            with open(os.path.join(output_dir, spec["filename"]), 'wb') as file:
+                file.write(data)
+    except Exception as e:
+        print(f"Error generating {'rental ' if is_rental else ''}graphs: {e}")
+        return None
 
 
-            # Filter for properties with both list and sold prices
-            valid_data = df_clean
+# Marks an upload that is being removed, so a report starting meanwhile does not claim it back
+REMOVING = -1
 
-            if not valid_data.empty:
-                addresses = valid_data['Address'].tolist()
-                list_prices = valid_data['List Price'].tolist()
-                sold_prices = valid_data['Sold Price'].tolist()
-                
-                x = range(len(addresses))
-                width = 0.35
-            
-                plt.bar([i - width/2 for i in x], list_prices, width, label='List Price', color='skyblue', alpha=0.8)
-                plt.bar([i + width/2 for i in x], sold_prices, width, label='Sold Price', color='lightcoral', alpha=0.8)         
-                plt.xlabel('Properties')
-                plt.ylabel('Price ($ MM)')
-                plt.title('List Price vs Sold Price Comparison')
-                plt.xticks(x, [addr.split()[0] + ' ' + addr.split()[1] if len(addr.split()) > 1 else addr for addr in addresses], rotation=45, ha='right')
-                plt.legend()
-                plt.tight_layout()
-                plt.savefig(os.path.join(temp_dir, 'list_price_vs_sold_price.png'), dpi=300, bbox_inches='tight')
-                
-
-            # List $/Sq Ft vs Sold $/Sq Ft Bar Chart
-            plt.figure(figsize=(12, 8))
-
-            # Filter for properties with both list and sold price per sq ft
-            valid_sqft_data = df_clean.dropna(subset=['List $/Sq Ft (Living)', 'Sold $/Sq Ft (Living)'], how='all')
-
-            if not valid_sqft_data.empty:
-                addresses_sqft = valid_sqft_data['Address'].tolist()
-                list_sqft = valid_sqft_data['List $/Sq Ft (Living)'].tolist()
-                sold_sqft = valid_sqft_data['Sold $/Sq Ft (Living)'].tolist()
-                
-                x_sqft = range(len(addresses_sqft))
-                width = 0.35
-                
-                plt.bar([i - width/2 for i in x_sqft], list_sqft, width, label='List $/Sq Ft', color='lightgreen', alpha=0.8)
-                plt.bar([i + width/2 for i in x_sqft], sold_sqft, width, label='Sold $/Sq Ft', color='orange', alpha=0.8)
-                plt.xlabel('Properties')
-                plt.ylabel('Price per Sq Ft ($)')
-                plt.title('List \$/ Sq Ft vs Sold \$/ Sq Ft Comparison')
-                plt.xticks(x_sqft, [addr.split()[0] + ' ' + addr.split()[1] if len(addr.split()) > 1 else addr for addr in addresses_sqft], rotation=45, ha='right')
-                plt.legend()
-                plt.tight_layout()
-                plt.savefig(os.path.join(temp_dir, 'list_price_sqft_vs_sold_price_sqft.png'), dpi=300, bbox_inches='tight')
-        except Exception as e:
-            print(f"Error generating graphs: {e}")
-            return None
+def claim_files(file_ids):
+    """
+    Mark uploads as used by a running report, so a report finishing meanwhile does not remove them.
+    The counts live in the state store, so reports on other workers are covered too.
 
+    Returns:
+        list: The claimed file IDs, pass them to release_files when the report ends
+    """
+    # Unknown IDs are not counted, the report fails on them anyway
+    file_ids = [file_id for file_id in dict.fromkeys(file_ids) if file_id in uploaded_files]
+    for file_id in file_ids:
+        active_files.update_value(file_id, lambda count: count if count == REMOVING else count + 1, 0)
+    return file_ids
 
-def cleanup_temp_files():
-    """Clean up all temporary files except the final report"""
+def release_files(file_ids, remove=False):
+    """
+    Undo claim_files. With remove, the uploads no other running report or open session uses are
+    deleted with their parse results, the way a finished report cleans up after itself.
+    """
     try:
-        # Clean up uploaded PDFs
-        for file_info in uploaded_files.values():
-            if os.path.exists(file_info["file_path"]):
-                os.remove(file_info["file_path"])
-        
-        # Clean up generated graphs
-        graph_files = [
-            os.path.join(temp_dir, 'list_price_vs_sold_price.png'),
-            os.path.join(temp_dir, 'list_price_sqft_vs_sold_price_sqft.png')
-        ]
-        for graph_file in graph_files:
-            if os.path.exists(graph_file):
-                os.remove(graph_file)
-        
-        # Clear uploaded files dictionary
-        uploaded_files.clear()
+        keep = session_file_ids() if remove else set()
+        for file_id in file_ids:
+            last_user_removes = remove and file_id not in keep
+
+            def release(count):
+                if count == REMOVING:
+                    return count
+                count = max(0, count - 1)
+                return REMOVING if count == 0 and last_user_removes else count
+
+            if active_files.update_value(file_id, release, 0) == REMOVING and last_user_removes:
+                forget_upload(file_id)
     except Exception as e:
-        print(f"Error cleaning up temporary files: {e}")
+        print(f"Error cleaning up uploads: {e}")
+
+def remove_unused_uploads(file_ids):
+    """Delete the uploads that no running report or open session uses any more"""
+    release_files(claim_files(file_ids), remove=True)
+
+def convert_price_columns(combined_df_price, is_rental):
+    """Convert the price columns to numbers in place, the report tables show them this way"""
+    import pandas as pd
+    if not is_rental:
+        # Convert price columns to numeric, removing $ and commas
+        for col in ['List Price', 'Sold Price']:
+            combined_df_price[col] = pd.to_numeric(combined_df_price[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
+
+        for col in ['List $/Sq Ft (Living)', 'Sold $/Sq Ft (Living)']:
+            # Check if the column contains string data (object dtype usually indicates strings)
+            if combined_df_price[col].dtype == 'object':
+                combined_df_price[col] = pd.to_numeric(combined_df_price[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
+    else:
+        for col in ['List Price']:
+            combined_df_price[col] = pd.to_numeric(combined_df_price[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
+
+        for col in ['List $/Sq Ft (Living)']:
+            combined_df_price[col] = pd.to_numeric(combined_df_price[col], errors='coerce')
+
+def comparable_column(is_rental):
+    """Price per sq ft column the appraisal averages over the comparable properties"""
+    return 'List $/Sq Ft (Living)' if is_rental else 'Sold $/Sq Ft (Living)'
 
-def generate_appraisal_report(combined_df_price, input_sq_ft, is_rental):
+@timed("generate_appraisal_report")
+def generate_appraisal_report(combined_df_price, input_sq_ft, is_rental, comparison_mean=None):
     # Compare the average of the other properties to the target property
-    # Calculate the average of the other properties
-    # List containing inputs
+    # comparison_mean can be passed in when it is already known, e.g. from a report session's running totals
     try:
         result = []
         # Remove commas from input_sq_ft and convert to integer
         input_sq_ft = int(input_sq_ft.replace(',', ''))
-        if not is_rental:
-            # Convert price columns to numeric, removing $ and commas
-            for col in ['List Price', 'Sold Price']:
-                combined_df_price[col] = pd.to_numeric(combined_df_price[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
-
-            for col in ['List $/Sq Ft (Living)', 'Sold $/Sq Ft (Living)']:
-                # Check if the column contains string data (object dtype usually indicates strings)
-                if combined_df_price[col].dtype == 'object':
-                    combined_df_price[col] = pd.to_numeric(combined_df_price[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
-            
-        
+        convert_price_columns(combined_df_price, is_rental)
+        if comparison_mean is None:
             # Exclude the first index (input property) and calculate mean of remaining comparison properties
-            comparison_mean = combined_df_price['Sold $/Sq Ft (Living)'].iloc[1:].mean()
-            estimated_value = input_sq_ft * comparison_mean
-            result.append(f"Using the {len(combined_df_price) - 1} comparable properties, the average sold $/sq ft = ${comparison_mean:.2f}.")
-            result.append(f"Applying this to {combined_df_price['Address'].iloc[0]}'s {input_sq_ft} sq ft yields an estimated value of ~ ${estimated_value:.2f}.")
-            result.append(f"{combined_df_price['Address'].iloc[0]} ask of ${combined_df_price['List Price'].iloc[0]:,.0f} is {combined_df_price['List Price'].iloc[0]/estimated_value:.2f} times the estimated value.")
-            return result
-        else:
-            for col in ['List Price']:
-                combined_df_price[col] = pd.to_numeric(combined_df_price[col].str.replace('$', '').str.replace(',', ''), errors='coerce')
-
-            for col in ['List $/Sq Ft (Living)']:
-                # Check if the column contains string data (object dtype usually indicates strings)
-               combined_df_price[col] = pd.to_numeric(combined_df_price[col], errors='coerce')
-            # Exclude the first index (input property) and calculate mean of remaining comparison properties
-            comparison_mean = combined_df_price['List $/Sq Ft (Living)'].iloc[1:].mean()
-            estimated_value = input_sq_ft * comparison_mean
-            result.append(f"Using the {len(combined_df_price) - 1} comparable properties, the average list $/sq ft = ${comparison_mean:.2f}.")
-            result.append(f"Applying this to {combined_df_price['Address'].iloc[0]}'s {input_sq_ft} sq ft yields an estimated value of ~ ${estimated_value:.2f}.")
-            result.append(f"{combined_df_price['Address'].iloc[0]} ask of ${combined_df_price['List Price'].iloc[0]:,.0f} is {combined_df_price['List Price'].iloc[0]/estimated_value:.2f} times the estimated value.")
-            return result
+            comparison_mean = combined_df_price[comparable_column(is_rental)].iloc[1:].mean()
+        estimated_value = input_sq_ft * comparison_mean
+        price_kind = "list" if is_rental else "sold"
+        result.append(f"Using the {len(combined_df_price) - 1} comparable properties, the average {price_kind} $/sq ft = ${comparison_mean:.2f}.")
+        result.append(f"Applying this to {combined_df_price['Address'].iloc[0]}'s {input_sq_ft} sq ft yields an estimated value of ~ ${estimated_value:.2f}.")
+        result.append(f"{combined_df_price['Address'].iloc[0]} ask of ${combined_df_price['List Price'].iloc[0]:,.0f} is {combined_df_price['List Price'].iloc[0]/estimated_value:.2f} times the estimated value.")
+        return result
     except Exception as e:
         print(f"Error generating appraisal report: {e}")
         return
 
-def combine_to_dataframe(comparison_file_ids, manual_data = None, input_file: str = Query(..., description="Input file ID")):
-    
+def add_market_context(appraisal_report, property_df, is_rental):
+    """Append the subject subdivision's running market stats to the appraisal when APPRAISAL_MARKET_STATS is set"""
+    if not APPRAISAL_MARKET_STATS or not appraisal_report or 'Subdivision' not in property_df:
+        return
+    subdivision = property_df['Subdivision'].iloc[0]
+    # Missing subdivisions come through as None or NaN
+    line = market_stats.appraisal_line(subdivision, is_rental) if isinstance(subdivision, str) else None
+    if line:
+        appraisal_report.append(line)
+
+def make_workspace(job_id):
+    """Scratch directory for one report's charts and PDF, so concurrent reports never share files"""
+    workspace = os.path.join(temp_dir, job_id)
+    os.makedirs(workspace, exist_ok=True)
+    return workspace
+
+def remove_workspace(job_id):
+    shutil.rmtree(os.path.join(temp_dir, job_id), ignore_errors=True)
+
+def set_job_status(job_id, status, **details):
+    """Record the state of a report job so any worker can answer /jobs/{job_id}"""
+    report_jobs[job_id] = {"status": status, "updated_at": time.time(), **details}
+
+def parse_pdf(cache_key, source):
+    """extract_property_info cached in the state store by content hash, source is a path or the PDF bytes"""
+    cached = parse_results.get(cache_key)
+    metrics.record_cache_lookup("parse_results", cached is not None)
+    if cached is not None:
+        return tuple(cached)
+    if source is None:
+        # Uploads parsed in memory are not on disk, so there is nothing left to parse
+        print(f"No parse result or file left for upload {cache_key}")
+        return None
+    result = extract_property_info(source)
+    if result is not None:
+        parse_results[cache_key] = list(result)
+        try:
+            market_stats.record(cache_key, result)
+        except Exception as e:
+            print(f"Error updating market stats for {cache_key}: {e}")
+        try:
+            listing_archive.record(cache_key, result)
+        except Exception as e:
+            print(f"Error saving listings for export from {cache_key}: {e}")
+    return result
+
+def parse_uploaded_file(file_id):
+    """extract_property_info for an upload, parsed at most once per distinct content"""
+    file_info = uploaded_files[file_id]
+    return parse_pdf(file_info.get("sha256") or file_id, file_info["file_path"])
+
+def ingest_upload(cache_key, content, file_path):
+    """
+    Parse an upload held in memory, so its reports only read the parse cache, and write it to
+    file_path only when RETAIN_UPLOADS is set.
+
+    Returns:
+        str: file_path when the upload was written there, None when it only lived in memory
+    """
+    parse_pdf(cache_key, content)
+    if not RETAIN_UPLOADS:
+        return None
+    with open(file_path, 'wb') as file:
+        file.write(content)
+    return file_path
+
+def forget_upload(file_id):
+    """Remove an upload's record, its file if it has one, and its parse result unless another upload has the same content"""
+    file_info = uploaded_files.pop(file_id, None)
+    active_files.pop(file_id, None)
+    if file_info is None:
+        return
+    if file_info["file_path"] and os.path.exists(file_info["file_path"]):
+        os.remove(file_info["file_path"])
+    # Forget it as the last input upload, unless a newer upload from another flow has replaced it
+    session_state.update_value("input_file_id", lambda current: None if current == file_id else current)
+    sha256 = file_info.get("sha256")
+    if sha256 and not any(other.get("sha256") == sha256 for other in uploaded_files.values()):
+        parse_results.pop(sha256, None)
+
+def parse_money(value):
+    """'$1,250,000' style value as a float, NaN when it is missing or not a number"""
+    try:
+        return float(str(value).replace('$', '').replace(',', ''))
+    except ValueError:
+        return float('nan')
+
+def comparable_totals(price_rows, is_rental):
+    """Sum and count of one comparison file's $/sq ft values that the appraisal averages"""
+    values = [parse_money(row.get(comparable_column(is_rental))) for row in price_rows]
+    values = [value for value in values if not math.isnan(value)]
+    return [sum(values), len(values)]
+
+def data_fingerprint(*values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+def update_session_analysis(session_id, input_file, comparison_file_ids, check=None):
+    """
+    Bring a report session up to date with the requested comparison set.
+
+    Only comparison files that were not in the session's last report are parsed, and the
+    appraisal totals are adjusted by the files that were added or dropped.
+
+    Returns:
+        tuple: (session record, added file IDs, dropped file IDs)
+    """
+    session = analysis_sessions.get(session_id)
+    if session is None or session["input_file"] != input_file:
+        # New session or a different subject, start over
+        subject = parse_uploaded_file(input_file)
+        if subject is None:
+            raise HTTPException(status_code=422, detail="Could not read the input file")
+        # The subject PDF's own extra listings are comparables too, as in the full report's mean
+        session = {
+            "input_file": input_file,
+            "subject": list(subject),
+            "comps": {},
+            "totals": comparable_totals(subject[1][1:], subject[3]),
+            "chart_fingerprint": None
+        }
+    comps = session["comps"]
+    added = [file_id for file_id in comparison_file_ids if file_id not in comps]
+    dropped = [file_id for file_id in comps if file_id not in comparison_file_ids]
+    for file_id in added:
+        if file_id not in uploaded_files or uploaded_files[file_id]["type"] != "comparison":
+            raise HTTPException(status_code=404, detail=f"Comparison file {file_id} not found")
+    for file_id in dropped:
+        total, count = comps.pop(file_id)["totals"]
+        session["totals"] = [session["totals"][0] - total, session["totals"][1] - count]
+    for file_id in added:
+        if check is not None:
+            check()
+        result = parse_uploaded_file(file_id)
+        if result is None:
+            raise HTTPException(status_code=422, detail=f"Could not read comparison file {file_id}")
+        result = list(result)
+        totals = comparable_totals(result[1], result[3])
+        comps[file_id] = {"result": result, "totals": totals}
+        session["totals"] = [session["totals"][0] + totals[0], session["totals"][1] + totals[1]]
+    session["comparison_file_ids"] = comparison_file_ids
+    return session, added, dropped
+
+def session_dataframes(session):
+    """DataFrames for a session in the same shape combine_to_dataframe returns"""
+    import pandas as pd
+    property_rows, price_rows, features_rows, is_rental = session["subject"]
+    property_rows, price_rows, features_rows = list(property_rows), list(price_rows), list(features_rows)
+    for file_id in session["comparison_file_ids"]:
+        comp_property_info, comp_price_info, comp_features_info, is_rental = session["comps"][file_id]["result"]
+        if comp_property_info and comp_price_info:
+            property_rows.extend(comp_property_info)
+            price_rows.extend(comp_price_info)
+            features_rows.extend(comp_features_info)
+    return pd.DataFrame(property_rows), pd.DataFrame(price_rows), pd.DataFrame(features_rows), is_rental
+
+def session_file_ids():
+    """Uploads still referenced by an open report session"""
+    file_ids = set()
+    for session in analysis_sessions.values():
+        file_ids.add(session["input_file"])
+        file_ids.update(session["comps"])
+    return file_ids
+
+@timed("combine_to_dataframe")
+def combine_to_dataframe(comparison_file_ids, manual_data = None, input_file: str = Query(..., description="Input file ID"), check=None):
+    import pandas as pd
     if manual_data is not None:
         try:
             # Convert manual data to the same format as extracted data
@@ -580,11 +768,8 @@ def combine_to_dataframe(comparison_file_ids, manual_data = None, input_file: st
     else:
         try:
                 # Get file paths
-            input_file_path = uploaded_files[input_file]["file_path"]
-            comparison_file_paths = [uploaded_files[fid]["file_path"] for fid in comparison_file_ids]
-            
             # Process input file with extract_property_info
-            input_property_info, input_price_info, input_features_info, is_rental = extract_property_info(input_file_path)
+            input_property_info, input_price_info, input_features_info, is_rental = parse_uploaded_file(input_file)
         except Exception as e:
             print("Error in combining input file to dataframe", str(e))
             return None
@@ -594,15 +779,16 @@ def combine_to_dataframe(comparison_file_ids, manual_data = None, input_file: st
             if file_id not in uploaded_files or uploaded_files[file_id]["type"] != "comparison":
                 raise HTTPException(status_code=404, detail=f"Comparison file {file_id} not found")
         
-        # Get comparison file paths
-        comparison_file_paths = [uploaded_files[fid]["file_path"] for fid in comparison_file_ids]
         # Result lists
         all_comparison_property_info = []
         all_comparison_price_info = []
         all_comparison_features_info = []
         # Process all comparison files
-        for comp_file_path in comparison_file_paths:
-            comp_property_info, comp_price_info, comp_features_info, is_rental = extract_property_info(comp_file_path)
+        for comp_file_id in comparison_file_ids:
+            # check lets a cancelled report stop between files
+            if check is not None:
+                check()
+            comp_property_info, comp_price_info, comp_features_info, is_rental = parse_uploaded_file(comp_file_id)
             if comp_property_info and comp_price_info:
                 all_comparison_property_info.extend(comp_property_info)
                 all_comparison_price_info.extend(comp_price_info)
@@ -616,12 +802,75 @@ def combine_to_dataframe(comparison_file_ids, manual_data = None, input_file: st
         all_price_info = pd.DataFrame(all_price_info)
         all_features_info = pd.DataFrame(all_features_info)
         return all_property_info, all_price_info, all_features_info, is_rental
+    except JobCancelled:
+        raise
     except Exception as e:
         print("Error in combining all data into dataframe", str(e))
         return None
 
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build_report_from_paths(input_path, comparison_paths, report_path):
+    """
+    Run the report pipeline on PDFs already on disk, without going through the upload endpoints.
+    Used by batch.py.
+
+    Returns:
+        dict: Seconds spent in each stage
+    """
+    from report_render import render_report
+    job_id = f"batch_{uuid.uuid4().hex[:8]}"
+    file_ids = []
+    timings = {}
+    try:
+        # Register the PDFs like uploads so parsing goes through the same content-hash cache
+        for path, file_type in [(input_path, "input")] + [(path, "comparison") for path in comparison_paths]:
+            file_id = f"{job_id}_{len(file_ids)}"
+            uploaded_files[file_id] = {
+                "filename": os.path.basename(path),
+                "file_path": path,
+                "file_size": os.path.getsize(path),
+                "sha256": file_sha256(path),
+                "type": file_type
+            }
+            file_ids.append(file_id)
+
+        start = time.perf_counter()
+        combined = combine_to_dataframe(file_ids[1:], None, file_ids[0])
+        if combined is None:
+            raise ValueError("Could not extract the input or comparison PDFs")
+        all_property_info, all_price_info, all_features_info, is_rental = combined
+        timings["parse"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        workspace = make_workspace(job_id)
+        generate_graphs(all_price_info, is_rental, workspace)
+        timings["charts"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        input_sq_ft = all_property_info['Living Sq Ft'].iloc[0]
+        appraisal_report = generate_appraisal_report(all_price_info, input_sq_ft, is_rental)
+        timings["appraisal"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        render_report(report_path, all_property_info, all_price_info, appraisal_report,
+                      os.path.join(workspace, 'list_price_vs_sold_price.png'),
+                      os.path.join(workspace, 'list_price_sqft_vs_sold_price_sqft.png'),
+                      amenity_df=amenity_tagger.matrix(all_features_info))
+        timings["build"] = time.perf_counter() - start
+        return timings
+    finally:
+        for file_id in file_ids:
+            uploaded_files.pop(file_id, None)
+        remove_workspace(job_id)
+
 # Create FastAPI app instance
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 app.add_middleware(
 CORSMiddleware,
@@ -630,11 +879,97 @@ allow_credentials=True,
 allow_methods=["*"],
 allow_headers=["*"],
 )
-input_file_path = ""
-# Global storage for uploaded files (in production, use a database)
-uploaded_files = {}
-# Create temporary directory for processing
-temp_dir = tempfile.mkdtemp(prefix="real_estate_")
+app.add_middleware(ProfilingMiddleware)
+
+def route_template(scope):
+    """Path template of the route a request will hit, so metrics are not labelled per file or report ID"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+class RequestMetricsMiddleware:
+    """
+    Record request latency and in-flight requests per route.
+
+    Plain ASGI rather than @app.middleware("http"), which runs the app behind its own receive
+    channel so request.is_disconnected() never sees the client go and report builds are not cancelled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = route_template(scope)
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        with metrics.REQUESTS_IN_FLIGHT.track_inprogress(method=method, route=route):
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                elapsed = time.perf_counter() - start
+                metrics.REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=status)
+                if startup_state["first_request_seconds"] is None and route not in ("/", "/ready", "/metrics"):
+                    startup_state["first_request_seconds"] = elapsed
+                    metrics.STARTUP_SECONDS.set(elapsed, phase="first_request")
+
+app.add_middleware(RequestMetricsMiddleware)
+
+# Upload records, parse results, report jobs and the current subject live in a state store
+# (STATE_BACKEND=sqlite to share them between uvicorn workers or pods)
+state_store = create_state_store()
+uploaded_files = StateNamespace(state_store, "uploads")
+parse_results = StateNamespace(state_store, "parse")
+report_jobs = StateNamespace(state_store, "jobs")
+# Number of running reports using each upload, see claim_files
+active_files = StateNamespace(state_store, "active_files")
+session_state = StateNamespace(state_store, "session")
+# Report sessions (session_id on /generate-report) keep the parsed comps, appraisal totals and
+# chart fingerprint of their last report so a regeneration only redoes what changed
+analysis_sessions = StateNamespace(state_store, "analysis")
+# Running $/sq ft, DOM and sold/list statistics per subdivision and status, fed by every parse
+market_stats = MarketStats(state_store)
+# Typed rows of every parsed listing for /export/listings, kept after the uploads are removed
+listing_archive = listing_export.ListingArchive(state_store)
+# Compiled once from AMENITY_VOCABULARY_PATH or the built-in vocabulary
+amenity_tagger = AmenityTagger(load_vocabulary())
+# Rendered chart PNGs shared by every report in this process, and across workers when CHART_CACHE_DIR is set
+chart_cache = ChartCache()
+# Signs the short-lived report links handed to the PDF viewer
+report_signer = ReportUrlSigner(StateNamespace(state_store, "secrets"))
+# Create temporary directory for processing, UPLOAD_DIR should point at a shared volume when
+# running more than one pod
+UPLOAD_DIR = os.getenv("UPLOAD_DIR")
+if UPLOAD_DIR:
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    temp_dir = UPLOAD_DIR
+else:
+    temp_dir = tempfile.mkdtemp(prefix="real_estate_")
+# Load the rendering stack in the background at startup and hold /ready at 503 until it is done
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+startup_state = {
+    "ready": not WARMUP_ON_STARTUP,
+    "import_seconds": None,
+    "warmup_seconds": None,
+    "first_request_seconds": None
+}
+# Add the subject subdivision's running market stats to the appraisal section
+APPRAISAL_MARKET_STATS = os.getenv("APPRAISAL_MARKET_STATS", "0") == "1"
+# Number of comparison PDFs from one upload that are saved and classified at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+# Also write uploads that were parsed in memory to the temporary directory, e.g. to re-parse them later
+RETAIN_UPLOADS = os.getenv("RETAIN_UPLOADS", "0") == "1"
 
 # Create reports directory for final outputs only
 reports_dir = "reports"
@@ -663,12 +998,53 @@ class ManualInputData(BaseModel):
     exterior: str
     publicRemarks: str
 
+def warm_up():
+    """Import the heavy libraries, build the report styles and prime matplotlib's font cache"""
+    start = time.perf_counter()
+    import pandas
+    import report_render
+    import PyPDF2
+    # Drawing text once loads the font manager cache and the Agg renderer. It goes through render_chart's
+    # standalone figure, so it never touches pyplot's current figure while requests draw their charts
+    render_chart({
+        "figsize": (2, 2), "labels": ["A", "B"], "ylabel": "Price", "title": r"List \$/ Sq Ft Comparison", "dpi": 72,
+        "series": [{"label": "List Price", "values": [1, 2], "color": "skyblue"}],
+    })
+    report_render.calc_col_widths(report_render.PROPERTY_COLUMNS)
+    elapsed = time.perf_counter() - start
+    startup_state["warmup_seconds"] = elapsed
+    metrics.STARTUP_SECONDS.set(elapsed, phase="warmup")
+    print(f"Warm-up finished in {elapsed:.2f}s")
+
+async def run_warm_up():
+    try:
+        await run_in_threadpool(warm_up)
+    except Exception as e:
+        print(f"Error during warm-up: {e}")
+    finally:
+        startup_state["ready"] = True
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARMUP_ON_STARTUP:
+        asyncio.create_task(run_warm_up())
+
 # API Endpoints
 @app.get("/")
 async def root():
     """Root endpoint for testing"""
     return {"message": "Real Estate PDF Analysis API is running!"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe, returns 503 until the optional warm-up has finished"""
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503, content=startup_state)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage timings, request latency and cache counters in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/upload-input-pdf")
 async def upload_input_pdf(file: UploadFile = File(...), token: str = Depends(verify_token)):
     """Upload the main MLS report PDF"""
@@ -681,19 +1057,23 @@ async def upload_input_pdf(file: UploadFile = File(...), token: str = Depends(ve
         # Generate unique file ID
         file_id = f"input_{uuid.uuid4().hex[:8]}"
         
-        # Save file to temporary directory
+        # Small files are classified and parsed straight from memory, larger ones go to the temporary directory
         file_path = os.path.join(temp_dir, f"{file_id}.pdf")
-        global input_file_path
-        input_file_path = file_path
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        content, file_size, sha256 = await read_upload(file, file_path)
+        property_type = await run_in_threadpool(extract_property_type, file_path if content is None else content)
+        if content is not None:
+            file_path = await run_in_threadpool(ingest_upload, sha256, content, file_path)
         # Store file info
         uploaded_files[file_id] = {
             "filename": file.filename,
             "file_path": file_path,
-            "file_size": os.path.getsize(file_path),
+            "file_size": file_size,
+            "sha256": sha256,
+            "property_type": property_type,
             "type": "input"
         }
+        # Later comparison uploads are checked against the latest subject
+        session_state["input_file_id"] = file_id
         
         return {
             "success": True,
@@ -703,15 +1083,15 @@ async def upload_input_pdf(file: UploadFile = File(...), token: str = Depends(ve
             "file_size": uploaded_files[file_id]["file_size"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-@app.post("/upload-comparison-pdf")
-async def upload_comparison_pdf(files: List[UploadFile] = File(...), token: str = Depends(verify_token)):
-    """Upload comparison property PDFs"""
-    try:
-        uploaded_file_info = []
-        for file in files:
+async def save_comparison_file(file, semaphore):
+    """Persist and classify one comparison PDF, an UploadFile or a ZipMember, returning its result instead of raising"""
+    async with semaphore:
+        try:
             # Validate file type
             if not file.filename.lower().endswith('.pdf'):
                 raise HTTPException(status_code=400, detail=f"File {file.filename} is not a PDF")
@@ -719,67 +1099,138 @@ async def upload_comparison_pdf(files: List[UploadFile] = File(...), token: str
             # Generate unique file ID
             file_id = f"comp_{uuid.uuid4().hex[:8]}"
             
-            # Save file to temporary directory
+            # Small files are classified and parsed straight from memory, larger ones go to the temporary directory
             file_path = os.path.join(temp_dir, f"{file_id}.pdf")
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            temp_property_type = extract_property_type(file_path)
+            content, file_size, sha256 = await read_upload(file, file_path)
+            property_type = await run_in_threadpool(extract_property_type, file_path if content is None else content)
+            if content is not None:
+                file_path = await run_in_threadpool(ingest_upload, sha256, content, file_path)
             
             # Store file info
             uploaded_files[file_id] = {
                 "filename": file.filename,
                 "file_path": file_path,
-                "file_size": os.path.getsize(file_path),
+                "file_size": file_size,
+                "sha256": sha256,
+                "property_type": property_type,
                 "type": "comparison"
             }
-            
-            uploaded_file_info.append({
+            return {
+                "success": True,
                 "file_id": file_id,
                 "filename": file.filename,
-                "file_size": uploaded_files[file_id]["file_size"]
-            })
-            global input_file_path
-            current_property_type = extract_property_type(input_file_path)
-            if temp_property_type != current_property_type:
-                try:
-                    print("Type mismatch")
-                    # Call comparison function to auto fill the data
-                    # Think of best way to optimize this as the information is already extracted from the file, save locally it does not have to be run again
-                    property_info, price_info, features_info, is_rental = extract_property_info(input_file_path)
-                    
-                    extracted_data = {}
-                    
-                    if property_info and len(property_info) > 0:
-                        for key, value in property_info[0].items():
-                            key = key.replace(" ", "")
-                            key  = key.lower()
-                            if value is not None:
-                                extracted_data[key] = value
-                    if features_info and len(features_info) > 0:
-                        for key, value in features_info[0].items():
-                            key = key.replace(" ", "")
-                            key  = key.lower()
-                            if value is not None:
-                                extracted_data[key] = value
-                    return {
-                        "success": True,
-                        "type_mismatch": True,
-                        "message": "Type mismatch, auto filled data",
-                        "uploaded_files": uploaded_file_info,
-                        "extracted_data": extracted_data   
-                    }
-                except Exception as e:
-                    print(f"Error in type mismatch: {e}")
-            
-        return {
-            "success": True,
-            "type_mismatch": False,
-            "message": f"{len(uploaded_file_info)} comparison PDF(s) uploaded successfully",
-            "uploaded_files": uploaded_file_info
-        }
-        
+                "file_size": file_size,
+                "property_type": property_type,
+                # False when the file was too large to parse in memory, it is parsed by the first report instead
+                "parsed": sha256 in parse_results
+            }
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"Error uploading comparison file {file.filename}: {error}")
+            return {
+                "success": False,
+                "filename": file.filename,
+                "error": error
+            }
+
+@app.post("/upload-comparison-pdf")
+async def upload_comparison_pdf(files: List[UploadFile] = File(...), token: str = Depends(verify_token)):
+    """Upload comparison property PDFs"""
+    try:
+        # Persist and classify the batch concurrently, results come back in upload order
+        semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        results = await asyncio.gather(*(save_comparison_file(file, semaphore) for file in files))
+        return comparison_upload_response(results)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+@app.post("/upload-comparison-zip")
+async def upload_comparison_zip(file: UploadFile = File(...), token: str = Depends(verify_token)):
+    """Upload a ZIP archive of comparison property PDFs, read member by member without extracting it"""
+    try:
+        if not file.filename.lower().endswith('.zip'):
+            raise HTTPException(status_code=400, detail="Only ZIP archives are allowed")
+        archive = await run_in_threadpool(ZipArchive, file)
+        try:
+            # Members are decompressed, classified and parsed concurrently like a multi-file upload
+            semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+            results = await asyncio.gather(*(save_comparison_file(member, semaphore) for member in archive.members()))
+        finally:
+            await run_in_threadpool(archive.close)
+        if not results:
+            raise HTTPException(status_code=400, detail=f"Archive {file.filename} contains no files")
+        return comparison_upload_response(results)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+def comparison_upload_response(results):
+    """Response for a batch of save_comparison_file results, auto filling the subject's data on a property type mismatch"""
+    uploaded_file_info = [
+        {"file_id": result["file_id"], "filename": result["filename"], "file_size": result["file_size"]}
+        for result in results if result["success"]
+    ]
+    failed_files = [
+        {"filename": result["filename"], "error": result["error"]}
+        for result in results if not result["success"]
+    ]
+    if not uploaded_file_info:
+        raise HTTPException(status_code=400, detail="; ".join(failed["error"] for failed in failed_files))
+    message = f"{len(uploaded_file_info)} comparison PDF(s) uploaded successfully"
+    if failed_files:
+        message += f", {len(failed_files)} failed"
+
+    input_file_id = session_state.get("input_file_id")
+    # Classified when the subject was uploaded, so it is not read again here
+    current_property_type = uploaded_files[input_file_id].get("property_type") if input_file_id in uploaded_files else None
+    type_mismatch = current_property_type is not None and any(
+        result["property_type"] != current_property_type for result in results if result["success"]
+    )
+    if type_mismatch:
+        try:
+            print("Type mismatch")
+            # Call comparison function to auto fill the data
+            # Think of best way to optimize this as the information is already extracted from the file, save locally it does not have to be run again
+            property_info, price_info, features_info, is_rental = parse_uploaded_file(input_file_id)
+            
+            extracted_data = {}
+            
+            if property_info and len(property_info) > 0:
+                for key, value in property_info[0].items():
+                    key = key.replace(" ", "")
+                    key  = key.lower()
+                    if value is not None:
+                        extracted_data[key] = value
+            if features_info and len(features_info) > 0:
+                for key, value in features_info[0].items():
+                    key = key.replace(" ", "")
+                    key  = key.lower()
+                    if value is not None:
+                        extracted_data[key] = value
+            return {
+                "success": True,
+                "type_mismatch": True,
+                "message": "Type mismatch, auto filled data",
+                "uploaded_files": uploaded_file_info,
+                "failed_files": failed_files,
+                "results": results,
+                "extracted_data": extracted_data   
+            }
+        except Exception as e:
+            print(f"Error in type mismatch: {e}")
+        
+    return {
+        "success": True,
+        "type_mismatch": False,
+        "message": message,
+        "uploaded_files": uploaded_file_info,
+        "failed_files": failed_files,
+        "results": results
+    }
+
 @app.get("/generate-report-chatgpt")
 async def generate_report_chatgpt(input_file: str = Query(..., description="Input file ID"), 
                             comparison_files: str = Query(..., description="Comma-separated comparison file IDs"), token: str = Depends(verify_token)):
@@ -808,261 +1259,168 @@ async def generate_report_chatgpt(input_file: str = Query(..., description="Inpu
 
 
 @app.get("/generate-report")
-async def generate_report(input_file: str = Query(..., description="Input file ID"), 
-                            comparison_files: str = Query(..., description="Comma-separated comparison file IDs"), token: str = Depends(verify_token)):
+async def generate_report(request: Request, input_file: str = Query(..., description="Input file ID"), 
+                            comparison_files: str = Query(..., description="Comma-separated comparison file IDs"),
+                            session_id: Optional[str] = Query(None, description="Reuse the parsed files and charts of this session's last report"),
+                            orient: str = Query("columns", description="Table layout in report_data: columns or records"),
+                            token: str = Depends(verify_token)):
     """Generate property comparison report"""
+    if orient not in DATAFRAME_ORIENTS:
+        raise HTTPException(status_code=400, detail="orient must be columns or records")
+    # Wait for a build slot (503 with Retry-After when the queue is full), then build off the event loop
+    async with report_admission.slot():
+        return await run_cancellable(request, build_uploaded_report, input_file, comparison_files, session_id, orient)
+
+async def run_cancellable(request, func, *args):
+    """
+    Run a report build in the threadpool, cancelling it if the client disconnects.
+
+    The build stops at its next checkpoint and this waits for it, so the workspace is removed
+    and the admission slot is only handed on once the thread has really let go.
+    """
+    cancel = CancelToken()
+    task = asyncio.ensure_future(run_in_threadpool(func, *args, cancel=cancel))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if not task.done() and not cancel.cancelled and await request.is_disconnected():
+            cancel.cancel("client_disconnected")
+    return task.result()
+
+def build_uploaded_report(input_file, comparison_files, session_id=None, orient="columns", cancel=None):
+    """Build the report for uploaded files, run in the threadpool by /generate-report"""
+    from report_render import render_report
+    cancel = cancel or CancelToken()
+    # Generate unique report ID, also used to track the job in the state store
+    report_id = f"report_{uuid.uuid4().hex[:8]}"
+    set_job_status(report_id, "running")
+    # Parse comparison file IDs
+    comparison_file_ids = [fid.strip() for fid in comparison_files.split(",")]
+    report_files = claim_files([input_file, *comparison_file_ids])
+    succeeded = False
     try:
         # Validate input file exists
         if input_file not in uploaded_files or uploaded_files[input_file]["type"] != "input":
             raise HTTPException(status_code=404, detail="Input file not found")
         
-        # Parse comparison file IDs
-        comparison_file_ids = [fid.strip() for fid in comparison_files.split(",")]
-        
-        all_property_info, all_price_info, all_features_info, is_rental = combine_to_dataframe(comparison_file_ids, None, input_file)
-        
-        # Generate graphs
-        generate_graphs(all_price_info, is_rental)
-        
-        # Generate appraisal report
-        input_sq_ft = all_property_info['Living Sq Ft'].iloc[0]
-        appraisal_report = generate_appraisal_report(all_price_info, input_sq_ft, is_rental)
+        workspace = make_workspace(report_id)
+        incremental = None
+        if session_id:
+            # Only parse the comps added since the session's last report and keep its charts
+            # in the session workspace, redrawn only when the plotted data changed
+            previous = analysis_sessions.get(session_id)
+            with cancel.stage("parse"):
+                session, added, dropped = update_session_analysis(session_id, input_file, comparison_file_ids, cancel.check)
+                all_property_info, all_price_info, all_features_info, is_rental = session_dataframes(session)
+            chart_dir = make_workspace(f"session_{session_id}")
+            fingerprint = data_fingerprint(all_price_info.to_dict(orient="records"), is_rental)
+            charts_reused = fingerprint == session["chart_fingerprint"] and all(
+                os.path.exists(os.path.join(chart_dir, name))
+                for name in ('list_price_vs_sold_price.png', 'list_price_sqft_vs_sold_price_sqft.png')
+            )
+            metrics.record_cache_lookup("session_charts", charts_reused)
+            if not charts_reused:
+                with cancel.stage("chart"):
+                    generate_graphs(all_price_info, is_rental, chart_dir)
+                session["chart_fingerprint"] = fingerprint
+            # The appraisal mean comes from the session's running totals
+            total, count = session["totals"]
+            input_sq_ft = all_property_info['Living Sq Ft'].iloc[0]
+            appraisal_report = generate_appraisal_report(all_price_info, input_sq_ft, is_rental,
+                                                         comparison_mean=total / count if count else float('nan'))
+            analysis_sessions[session_id] = session
+            if previous is not None and previous["input_file"] != input_file:
+                # A new subject starts the session over, the old subject and comps it kept are let go
+                remove_unused_uploads([previous["input_file"], *previous["comps"]])
+            incremental = {"session_id": session_id, "parsed_files": added, "dropped_files": dropped, "charts_reused": charts_reused}
+        else:
+            with cancel.stage("parse"):
+                all_property_info, all_price_info, all_features_info, is_rental = combine_to_dataframe(comparison_file_ids, None, input_file, cancel.check)
+
+            # Generate graphs in this report's own workspace
+            chart_dir = workspace
+            with cancel.stage("chart"):
+                generate_graphs(all_price_info, is_rental, chart_dir)
+
+            # Generate appraisal report
+            input_sq_ft = all_property_info['Living Sq Ft'].iloc[0]
+            appraisal_report = generate_appraisal_report(all_price_info, input_sq_ft, is_rental)
+        add_market_context(appraisal_report, all_property_info, is_rental)
 
         # Create DataFrames
         combined_df = all_property_info
         combined_df_price = all_price_info 
         combined_df_features = all_features_info
+        amenity_df = amenity_tagger.matrix(combined_df_features)
 
         # Here generate prompt for chatgpt and prompt chatgpt api to give response
         # Break down the features to chatgpt5 and everything else to chatgpt4o-mini to minimize costs
 
-        # Styles for PDF report
-        styles = getSampleStyleSheet()
         # Generate PDF report in temporary directory
-        temp_pdf_path = os.path.join(temp_dir, "property_comparison.pdf")
-        doc = SimpleDocTemplate(temp_pdf_path, pagesize=letter, topMargin=30, bottomMargin=30, leftMargin=30, rightMargin=30)
-
-        # Generate styles for cells and table headers
-        cell_style = ParagraphStyle(
-            name='Cell',
-            parent=styles['BodyText'],
-            fontName='Times-Roman',
-            fontSize=10,
-            leading=12,
-            spaceAfter=0,
-            spaceBefore=0,
-            wordWrap='CJK',
-            alignment=1
-        )
-        cell_heading_style = ParagraphStyle(
-            name='CellHeading',
-            fontName='Times-Bold',
-            fontSize=12,
-            leading=12,
-        )
-        # Prepare data for PDF tables
-        property_data = [list(combined_df.columns)]
-        for index, row in combined_df.iterrows():
-            property_data.append([str(cell) if pd.notna(cell) else '' for cell in row])
-        
-        price_data = [list(combined_df_price.columns)]
-        for index, row in combined_df_price.iterrows():
-            price_data.append([str(cell) if pd.notna(cell) else '' for cell in row])
-        
-        # Compute column widths from header text, fit to available width
-        def _calc_col_widths(headers, font_name, font_size, available_width):
-            padding = 12  # horizontal padding per cell (left+right)
-            min_w = 0.6 * inch
-            max_w = 2.2 * inch
-            raw_widths = []
-            for h in headers:
-                text = str(h)
-                w = stringWidth(text, font_name, font_size) + 2 * padding
-                w = max(min_w, min(max_w, w))
-                raw_widths.append(w)
-            total = sum(raw_widths) or 1.0
-            if total > available_width:
-                scale = available_width / total
-                raw_widths = [max(min_w, w * scale) for w in raw_widths]
-            return raw_widths
-
-        header_font = getattr(cell_heading_style, 'fontName', 'Times-Bold')
-        header_size = getattr(cell_heading_style, 'fontSize', 12)
-        available_width = doc.width
-        property_col_widths = _calc_col_widths(property_data[0], header_font, header_size, available_width)
-        price_col_widths = _calc_col_widths(price_data[0], header_font, header_size, available_width)
-
-        # Wrap all cell content in Paragraph objects for word wrapping
-        for i, row in enumerate(property_data):
-            for j, cell in enumerate(row):
-                if i == 0:  # Header row
-                    property_data[i][j] = Paragraph(str(cell), cell_heading_style)
-                else:
-                    property_data[i][j] = Paragraph(str(cell), cell_style)
-        
-        for i, row in enumerate(price_data):
-            for j, cell in enumerate(row):
-                if i == 0:  # Header row
-                    price_data[i][j] = Paragraph(str(cell), cell_heading_style)
-                else:
-                    price_data[i][j] = Paragraph(str(cell), cell_style)
-        
-                 # Create tables
-        property_table = Table(property_data, colWidths=property_col_widths)
-        price_table = Table(price_data, colWidths=price_col_widths)
-        
-                 # Apply table styles
-        property_table.setStyle(TableStyle([
-             ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-             ('FONTNAME', (0, 0), (-1, 0), 'Times-Roman'),
-             ('FONTSIZE', (0, 0), (-1, 0), 9),
-             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-             ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-             ('FONTNAME', (0, 1), (0, -1), 'Times-Bold'),
-             ('FONTSIZE', (0, 1), (0, -1), 7),
-             ('BACKGROUND', (0, 1), (0, -1), colors.lightblue),
-             ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.beige, colors.white]),
-         ]))
-        
-        price_table.setStyle(TableStyle([
-             ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-             ('FONTNAME', (0, 0), (-1, 0), 'Times-Roman'),
-             ('FONTSIZE', (0, 0), (-1, 0), 9),
-             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-             ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-             ('FONTNAME', (0, 1), (0, -1), 'Times-Bold'),
-             ('FONTSIZE', (0, 1), (0, -1), 7),
-             ('BACKGROUND', (0, 1), (0, -1), colors.lightblue),
-             ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.beige, colors.white]),
-         ]))
-        
-        # Define styles
-        title_style = ParagraphStyle(
-            name='Title',
-            parent=styles['Title'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=1
-        )
-        
-        heading_style = ParagraphStyle(
-            name='Heading1',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=12,
-            spaceBefore=12
-        )
-        
-        # Build PDF story
-        story = [
-            Paragraph("Property Comparison Analysis", title_style),
-            Spacer(1, 20),
-            Paragraph("Property Features Comparison", heading_style),
-            property_table,
-            Spacer(1, 30),
-            Paragraph("Price & Market Analysis", heading_style),
-            price_table,
-            PageBreak(),
-            Paragraph("List Price vs Sold Price", heading_style),
-        ]
-        
-        # Add graphs
-        try:
-            price_chart_path = os.path.join(temp_dir, 'list_price_vs_sold_price.png')
-            sqft_chart_path = os.path.join(temp_dir, 'list_price_sqft_vs_sold_price_sqft.png')
-            
-            if os.path.exists(price_chart_path):
-                price_chart = Image(price_chart_path, width=7*inch, height=5*inch)
-                story.append(price_chart)
-                story.append(Spacer(1, 10))
-            
-            if os.path.exists(sqft_chart_path):
-                story.append(PageBreak())
-                story.append(Paragraph("List $/Sq Ft vs Sold $/Sq Ft", heading_style))
-                sqft_chart = Image(sqft_chart_path, width=7*inch, height=5*inch)
-                story.append(sqft_chart)
-        except Exception as e:
-            print(f"Error adding graphs to PDF: {e}")
-        
-        # Add appraisal report
-        story.append(PageBreak())
-        story.append(Paragraph("Appraisal Report", heading_style))
-        story.append(Paragraph("From a comparative market analysis viewpoint:", styles['Heading2']))
-        story.append(Spacer(1, 10))
-        
-        bullet_style = ParagraphStyle(
-            name='Bullet',
-            parent=styles['BodyText'],
-            fontName='Times-Roman',
-            fontSize=12,
-            leading=12,
-            spaceAfter=0,
-        )
-        for item in appraisal_report:
-            story.append(Paragraph(f"• {item}", bullet_style))
-            story.append(Spacer(1, 6))
-        
-        # Build the PDF
-        doc.build(story)
-        
-        # Generate unique report ID
-        report_id = f"report_{uuid.uuid4().hex[:8]}"
+        temp_pdf_path = os.path.join(workspace, "property_comparison.pdf")
+        with cancel.stage("build"):
+            render_report(temp_pdf_path, combined_df, combined_df_price, appraisal_report,
+                          os.path.join(chart_dir, 'list_price_vs_sold_price.png'),
+                          os.path.join(chart_dir, 'list_price_sqft_vs_sold_price_sqft.png'),
+                          check=cancel.check, amenity_df=amenity_df)
         
         # Move generated PDF to reports directory (final output)
         report_path = os.path.join(reports_dir, f"{report_id}.pdf")
         shutil.move(temp_pdf_path, report_path)
         
-        # Clean up temporary files
-        cleanup_temp_files()
+        set_job_status(report_id, "done", report_url=f"/download-report/{report_id}")
+        succeeded = True
+        remove_workspace(report_id)
         
-        # Convert DataFrames to dictionaries for JSON response
-        property_comparison = {}
-        for col in combined_df.columns:
-            # Convert column to dict and replace NaN values with 'N/A'
-            col_dict = combined_df[col].to_dict()
-            for key, value in col_dict.items():
-                if pd.isna(value):
-                    col_dict[key] = 'N/A'
-            property_comparison[col] = col_dict
+        # Convert DataFrames to dictionaries for JSON response, NaN values become 'N/A'
+        property_comparison = dataframe_payload(combined_df, orient)
+        price_analysis = dataframe_payload(combined_df_price, orient)
         
-        price_analysis = {}
-        for col in combined_df_price.columns:
-            # Convert column to dict and replace NaN values with 'N/A'
-            col_dict = combined_df_price[col].to_dict()
-            # Replace NaN values with 'N/A'
-            for key, value in col_dict.items():
-                if pd.isna(value):
-                    col_dict[key] = 'N/A'
-            price_analysis[col] = col_dict
-        
-        return {
+        # Returned as a response object so FastAPI skips its jsonable_encoder pass over the tables
+        return FastJSONResponse({
             "success": True,
             "message": "Report generated successfully",
             "report_data": {
                 "property_comparison": property_comparison,
                 "price_analysis": price_analysis,
-                "appraisal_report": appraisal_report
+                "appraisal_report": appraisal_report,
+                "amenities": dataframe_payload(amenity_df, orient)
             },
             "report_id": report_id,
             "report_url": f"/download-report/{report_id}",
             "graphs_generated": [
                 "list_price_vs_sold_price.png",
                 "list_price_sqft_vs_sold_price_sqft.png"
-            ]
-        }
-        
+            ],
+            "incremental": incremental
+        })
+        
+    except JobCancelled as e:
+        # Nobody is waiting for a disconnected client's response, a missed deadline gets a 504
+        set_job_status(report_id, "cancelled", reason=e.reason, stage=e.stage)
+        remove_workspace(report_id)
+        raise HTTPException(status_code=504, detail=f"Report generation cancelled: {str(e)}")
     except Exception as e:
+        set_job_status(report_id, "failed", error=str(e))
+        remove_workspace(report_id)
         raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
+    finally:
+        # Only this report's uploads are cleaned up, and only after a successful build so a failed one can be retried.
+        # A session keeps its uploads until DELETE /sessions/{session_id}
+        release_files(report_files, remove=succeeded and not session_id)
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, token: str = Depends(verify_token)):
+    """Close a report session and remove the uploads and charts it kept"""
+    session = analysis_sessions.pop(session_id, None)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    remove_workspace(f"session_{session_id}")
+    # Uploads shared with another open session or a running report stay
+    remove_unused_uploads([session["input_file"], *session["comps"]])
+    return {
+        "success": True,
+        "message": f"Session {session_id} closed"
+    }
 
 @app.post("/generate-chatgpt-prompt-manual")
 async def generate_chatgpt_prompt_manual(manual_data: ManualInputData, comparison_files: str = Query(..., description="Comma-separated comparison file IDs"), token: str = Depends(verify_token)):
@@ -1083,237 +1441,72 @@ async def generate_chatgpt_prompt_manual(manual_data: ManualInputData, compariso
 
 # HANDLE MANUAL INPUT
 @app.post("/generate-report-manual")
-async def generate_report_manual(manual_data: ManualInputData, comparison_files: str = Query(..., description="Comma-separated comparison file IDs"), token: str = Depends(verify_token)):
+async def generate_report_manual(request: Request, manual_data: ManualInputData, comparison_files: str = Query(..., description="Comma-separated comparison file IDs"),
+                                 orient: str = Query("columns", description="Table layout in report_data: columns or records"),
+                                 token: str = Depends(verify_token)):
     """Generate property comparison report with manual input data"""
+    if orient not in DATAFRAME_ORIENTS:
+        raise HTTPException(status_code=400, detail="orient must be columns or records")
+    async with report_admission.slot():
+        return await run_cancellable(request, build_manual_report, manual_data, comparison_files, orient)
+
+def build_manual_report(manual_data, comparison_files, orient="columns", cancel=None):
+    """Build the report for manually entered subject data, run in the threadpool by /generate-report-manual"""
+    from report_render import render_report
+    cancel = cancel or CancelToken()
+    # Generate unique report ID, also used to track the job in the state store
+    report_id = f"report_{uuid.uuid4().hex[:8]}"
+    set_job_status(report_id, "running")
+    # Parse comparison file IDs
+    comparison_file_ids = [fid.strip() for fid in comparison_files.split(",")]
+    report_files = claim_files(comparison_file_ids)
+    succeeded = False
     try:
-        # Parse comparison file IDs
-        comparison_file_ids = [fid.strip() for fid in comparison_files.split(",")]
+        with cancel.stage("parse"):
+            all_property_info, all_price_info, all_features_info, is_rental = combine_to_dataframe(comparison_file_ids, manual_data=manual_data, input_file=None, check=cancel.check)
         
-        all_property_info, all_price_info, all_features_info, is_rental = combine_to_dataframe(comparison_file_ids, manual_data=manual_data, input_file=None)
         
-        
-        generate_graphs(all_price_info, manual_data.isRental)
+        workspace = make_workspace(report_id)
+        with cancel.stage("chart"):
+            generate_graphs(all_price_info, manual_data.isRental, workspace)
         
         # Create DataFrames
         combined_df = all_property_info
         combined_df_price = all_price_info
-        combined_df_features = all_features_info    
+        combined_df_features = all_features_info
+        amenity_df = amenity_tagger.matrix(combined_df_features)
         # Generate appraisal report - use the manual input rental status
         input_sq_ft = all_property_info['Living Sq Ft'].iloc[0]
         appraisal_report = generate_appraisal_report(all_price_info, input_sq_ft, manual_data.isRental)
+        add_market_context(appraisal_report, all_property_info, manual_data.isRental)
         
-        # Styles for PDF report
-        styles = getSampleStyleSheet()
         # Generate PDF report in temporary directory
-        temp_pdf_path = os.path.join(temp_dir, "property_comparison.pdf")
-        doc = SimpleDocTemplate(temp_pdf_path, pagesize=letter, topMargin=30, bottomMargin=30, leftMargin=30, rightMargin=30)
-
-        # Generate styles for cells and table headers
-        cell_style = ParagraphStyle(
-            name='Cell',
-            parent=styles['BodyText'],
-            fontName='Times-Roman',
-            fontSize=10,
-            leading=12,
-            spaceAfter=0,
-            spaceBefore=0,
-            wordWrap='CJK',
-            alignment=1
-        )
-        cell_heading_style = ParagraphStyle(
-            name='CellHeading',
-            fontName='Times-Bold',
-            fontSize=12,
-            leading=12,
-        )
-        property_data = [list(combined_df.columns)]
-        for index, row in combined_df.iterrows():
-            property_data.append([str(cell) if pd.notna(cell) else '' for cell in row])
-        
-        price_data = [list(combined_df_price.columns)]
-        for index, row in combined_df_price.iterrows():
-            price_data.append([str(cell) if pd.notna(cell) else '' for cell in row])
-        
-        # Compute column widths from header text, fit to available width
-        def _calc_col_widths(headers, font_name, font_size, available_width):
-            padding = 12  # horizontal padding per cell (left+right)
-            min_w = 0.6 * inch
-            max_w = 2.2 * inch
-            raw_widths = []
-            for h in headers:
-                text = str(h)
-                w = stringWidth(text, font_name, font_size) + 2 * padding
-                w = max(min_w, min(max_w, w))
-                raw_widths.append(w)
-            total = sum(raw_widths) or 1.0
-            if total > available_width:
-                scale = available_width / total
-                raw_widths = [max(min_w, w * scale) for w in raw_widths]
-            return raw_widths
-
-        header_font = getattr(cell_heading_style, 'fontName', 'Times-Bold')
-        header_size = getattr(cell_heading_style, 'fontSize', 12)
-        available_width = doc.width
-        property_col_widths = _calc_col_widths(property_data[0], header_font, header_size, available_width)
-        price_col_widths = _calc_col_widths(price_data[0], header_font, header_size, available_width)
-
-        # Wrap all cell content in Paragraph objects for word wrapping
-        for i, row in enumerate(property_data):
-            for j, cell in enumerate(row):
-                if i == 0:  # Header row
-                    property_data[i][j] = Paragraph(str(cell), cell_heading_style)
-                else:
-                    property_data[i][j] = Paragraph(str(cell), cell_style)
-        
-        for i, row in enumerate(price_data):
-            for j, cell in enumerate(row):
-                if i == 0:  # Header row
-                    price_data[i][j] = Paragraph(str(cell), cell_heading_style)
-                else:
-                    price_data[i][j] = Paragraph(str(cell), cell_style)
-        
-                 # Create tables
-        property_table = Table(property_data, colWidths=property_col_widths)
-        price_table = Table(price_data, colWidths=price_col_widths)
-        # Apply table styles
-        property_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Times-Roman'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('FONTNAME', (0, 1), (0, -1), 'Times-Bold'),
-            ('FONTSIZE', (0, 1), (0, -1), 7),
-            ('BACKGROUND', (0, 1), (0, -1), colors.lightblue),
-            ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.beige, colors.white]),
-        ]))
-        
-        price_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Times-Roman'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('FONTNAME', (0, 1), (0, -1), 'Times-Bold'),
-            ('FONTSIZE', (0, 1), (0, -1), 7),
-            ('BACKGROUND', (0, 1), (0, -1), colors.lightblue),
-            ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.beige, colors.white]),
-        ]))
-        
-        # Define styles
-        title_style = ParagraphStyle(
-            name='Title',
-            parent=styles['Title'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=1
-        )
-        
-        heading_style = ParagraphStyle(
-            name='Heading1',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=12,
-            spaceBefore=12
-        )
-        
-        # Build PDF story
-        story = [
-            Paragraph("Property Comparison Analysis", title_style),
-            Spacer(1, 20),
-            Paragraph("Property Features Comparison", heading_style),
-            property_table,
-            Spacer(1, 30),
-            Paragraph("Price & Market Analysis", heading_style),
-            price_table,
-            PageBreak(),
-            Paragraph("List Price vs Sold Price", heading_style),
-        ]
-        
-        # Add graphs
-        try:
-            price_chart_path = os.path.join(temp_dir, 'list_price_vs_sold_price.png')
-            sqft_chart_path = os.path.join(temp_dir, 'list_price_sqft_vs_sold_price_sqft.png')
-            
-            if os.path.exists(price_chart_path):
-                price_chart = Image(price_chart_path, width=7*inch, height=5*inch)
-                story.append(price_chart)
-                story.append(Spacer(1, 10))
-            
-            if os.path.exists(sqft_chart_path):
-                story.append(PageBreak())
-                story.append(Paragraph("List $/Sq Ft vs Sold $/Sq Ft", heading_style))
-                sqft_chart = Image(sqft_chart_path, width=7*inch, height=5*inch)
-                story.append(sqft_chart)
-        except Exception as e:
-            print(f"Error adding graphs to PDF: {e}")
-        
-        # Add appraisal report
-        story.append(PageBreak())
-        story.append(Paragraph("Appraisal Report", heading_style))
-        story.append(Paragraph("From a comparative market analysis viewpoint:", styles['Heading2']))
-        story.append(Spacer(1, 10))
-        
-        bullet_style = ParagraphStyle(
-            name='Bullet',
-            parent=styles['BodyText'],
-            fontName='Times-Roman',
-            fontSize=12,
-            leading=12,
-            spaceAfter=0,
-        )
-        for item in appraisal_report:
-            story.append(Paragraph(f"• {item}", bullet_style))
-            story.append(Spacer(1, 6))
-        
-        # Build the PDF
-        doc.build(story)
-        
-        # Generate unique report ID
-        report_id = f"report_{uuid.uuid4().hex[:8]}"
+        temp_pdf_path = os.path.join(workspace, "property_comparison.pdf")
+        with cancel.stage("build"):
+            render_report(temp_pdf_path, combined_df, combined_df_price, appraisal_report,
+                          os.path.join(workspace, 'list_price_vs_sold_price.png'),
+                          os.path.join(workspace, 'list_price_sqft_vs_sold_price_sqft.png'),
+                          check=cancel.check, amenity_df=amenity_df)
         
         # Move generated PDF to reports directory (final output)
         report_path = os.path.join(reports_dir, f"{report_id}.pdf")
         shutil.move(temp_pdf_path, report_path)
         
-        # Clean up temporary files
-        cleanup_temp_files()
-        
-        property_comparison = {}
-        for col in combined_df.columns:
-            # Convert column to dict and replace NaN values with 'N/A'
-            col_dict = combined_df[col].to_dict()
-            for key, value in col_dict.items():
-                if pd.isna(value):
-                    col_dict[key] = 'N/A'
-            property_comparison[col] = col_dict
+        set_job_status(report_id, "done", report_url=f"/download-report/{report_id}")
+        succeeded = True
+        remove_workspace(report_id)
         
-        price_analysis = {}
-        for col in combined_df_price.columns:
-            # Convert column to dict and replace NaN values with 'N/A'
-            col_dict = combined_df_price[col].to_dict()
-            # Replace NaN values with 'N/A'
-            for key, value in col_dict.items():
-                if pd.isna(value):
-                    col_dict[key] = 'N/A'
-            price_analysis[col] = col_dict
-        return {
+        property_comparison = dataframe_payload(combined_df, orient)
+        price_analysis = dataframe_payload(combined_df_price, orient)
+        # Returned as a response object so FastAPI skips its jsonable_encoder pass over the tables
+        return FastJSONResponse({
             "success": True,
             "message": "Report generated successfully",
             "report_data": {
                 "property_comparison": property_comparison,
                 "price_analysis": price_analysis,
-                "appraisal_report": appraisal_report
+                "appraisal_report": appraisal_report,
+                "amenities": dataframe_payload(amenity_df, orient)
             },
             "report_id": report_id,
             "report_url": f"/download-report/{report_id}",
@@ -1321,13 +1514,51 @@ async def generate_report_manual(manual_data: ManualInputData, comparison_files:
                 "list_price_vs_sold_price.png",
                 "list_price_sqft_vs_sold_price_sqft.png"
             ]
-        }
+        })
         
+    except JobCancelled as e:
+        # Nobody is waiting for a disconnected client's response, a missed deadline gets a 504
+        set_job_status(report_id, "cancelled", reason=e.reason, stage=e.stage)
+        remove_workspace(report_id)
+        raise HTTPException(status_code=504, detail=f"Report generation cancelled: {str(e)}")
     except Exception as e:
+        set_job_status(report_id, "failed", error=str(e))
+        remove_workspace(report_id)
         raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
+    finally:
+        # Only this report's uploads are cleaned up, and only after a successful build so a failed one can be retried
+        release_files(report_files, remove=succeeded)
+
+def report_access(action):
+    """Dependency accepting a signed link for this report and action, or a Cognito bearer token"""
+    def verify_report_access(report_id: str, expires: Optional[int] = Query(None), sig: Optional[str] = Query(None),
+                             credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
+        if sig is not None:
+            # One HMAC compare, no JWKS lookup or RSA verify
+            if not report_signer.verify(report_id, action, expires, sig):
+                raise HTTPException(status_code=403, detail="Report link is invalid or has expired")
+            return None
+        if credentials is None:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return verify_token(credentials)
+    return verify_report_access
+
+@app.get("/report-links/{report_id}")
+async def get_report_links(report_id: str, token: str = Depends(verify_token)):
+    """Short-lived signed view and download URLs, so the PDF viewer never carries the JWT"""
+    if not os.path.exists(os.path.join(reports_dir, f"{report_id}.pdf")):
+        raise HTTPException(status_code=404, detail="Report not found")
+    view = report_signer.sign(report_id, "view")
+    download = report_signer.sign(report_id, "download")
+    return {
+        "report_id": report_id,
+        "view_url": f"/view-report/{report_id}?expires={view['expires']}&sig={view['sig']}",
+        "download_url": f"/download-report/{report_id}?expires={download['expires']}&sig={download['sig']}",
+        "expires_at": view["expires"]
+    }
 
 @app.get("/download-report/{report_id}")
-async def download_report(report_id: str, token: str = Depends(verify_token)):
+async def download_report(report_id: str, token: str = Depends(report_access("download"))):
     """Download the generated PDF report"""
     try:
         report_path = os.path.join("reports", f"{report_id}.pdf")
@@ -1345,7 +1576,7 @@ async def download_report(report_id: str, token: str = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
 @app.get("/view-report/{report_id}")
-async def view_report(report_id: str, token: str = Depends(verify_token_query)):
+async def view_report(report_id: str, token: str = Depends(report_access("view"))):
     """View the generated PDF report in browser"""
     try:
         report_path = os.path.join("reports", f"{report_id}.pdf")
@@ -1361,13 +1592,85 @@ async def view_report(report_id: str, token: str = Depends(verify_token_query)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"View failed: {str(e)}")
 
+@app.get("/market-stats")
+async def get_market_stats(subdivision: str = Query(..., description="Subdivision name, case insensitive"),
+                           status: Optional[str] = Query(None, description="Listing status, all statuses when omitted"),
+                           rental: bool = Query(False, description="Rental listings instead of sales"),
+                           token: str = Depends(verify_token)):
+    """Running $/sq ft, sold/list and days on market statistics for a subdivision, read without rescanning listings"""
+    summary = market_stats.lookup(subdivision, status, rental)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No parsed listings for this subdivision and status")
+    return summary
+
+@app.get("/similar-comparables")
+async def similar_comparables(input_file: str = Query(..., description="Input file ID"),
+                              comparison_files: str = Query(..., description="Comma-separated comparison file IDs"),
+                              limit: int = Query(5, ge=1, le=20, description="Shared and distinguishing terms per comparable"),
+                              token: str = Depends(verify_token)):
+    """Comparables ranked by TF-IDF similarity of their Interior, Exterior and Public Remarks text to the subject's, computed locally"""
+    if input_file not in uploaded_files or uploaded_files[input_file]["type"] != "input":
+        raise HTTPException(status_code=404, detail="Input file not found")
+    requested = list(dict.fromkeys(fid.strip() for fid in comparison_files.split(",") if fid.strip()))
+    # Unknown or already removed comparison files are reported back instead of shrinking the ranking silently
+    missing = [file_id for file_id in requested if file_id not in uploaded_files]
+    file_ids = [input_file] + [file_id for file_id in requested if file_id not in missing]
+
+    def collect_features():
+        features_rows, row_file_ids = [], []
+        for file_id in file_ids:
+            result = parse_uploaded_file(file_id)
+            if result is None:
+                missing.append(file_id)
+                continue
+            features_rows.extend(result[2])
+            row_file_ids.extend([file_id] * len(result[2]))
+        return features_rows, row_file_ids
+
+    features_rows, row_file_ids = await run_in_threadpool(collect_features)
+    if not features_rows or row_file_ids[0] != input_file:
+        raise HTTPException(status_code=400, detail="Could not extract the input PDF")
+    ranking = rank_comparables(features_rows, limit)
+    for item in ranking:
+        item["file_id"] = row_file_ids[item.pop("index")]
+    return {"subject": features_rows[0].get("Address"), "comparables": ranking, "missing": missing}
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, token: str = Depends(verify_token)):
+    """Status of a report job, the job ID is the report ID"""
+    if job_id not in report_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, **report_jobs[job_id]}
+
 @app.get("/files")
 async def list_uploaded_files(token: str = Depends(verify_token)):
     """List all uploaded files (for debugging)"""
     return {
-        "uploaded_files": uploaded_files
+        "uploaded_files": dict(uploaded_files.items())
     }
 
+@app.get("/export/listings")
+async def export_listings(file_format: str = Query("parquet", alias="format", description="parquet, arrow or csv"),
+                          status: Optional[str] = Query(None, description="Only listings with this status"),
+                          subdivision: Optional[str] = Query(None, description="Only listings in this subdivision"),
+                          rental: Optional[bool] = Query(None, description="Only rental (true) or sale (false) listings"),
+                          token: str = Depends(verify_token)):
+    """Stream every parsed listing, or a filtered set, with typed columns"""
+    if file_format not in listing_export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {file_format}, use parquet, arrow or csv")
+    if file_format != "csv" and not listing_export.pyarrow_available():
+        raise HTTPException(status_code=501, detail=f"{file_format} export needs pyarrow installed on the server, use format=csv")
+    # Listings are read from the state store and written batch by batch while the response streams
+    batches = listing_export.listing_batches(
+        listing_archive.iter_batches(listing_export.EXPORT_BATCH_SIZE), status, subdivision, rental
+    )
+    media_type, extension = listing_export.EXPORT_FORMATS[file_format]
+    return StreamingResponse(
+        listing_export.stream_listings(batches, file_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="listings{extension}"'}
+    )
+
 @app.delete("/files/{file_id}")
 async def delete_file(file_id: str, token: str = Depends(verify_token)):
     """Delete an uploaded file"""
@@ -1375,10 +1678,7 @@ async def delete_file(file_id: str, token: str = Depends(verify_token)):
         if file_id not in uploaded_files:
             raise HTTPException(status_code=404, detail="File not found")
         
-        file_info = uploaded_files[file_id]
-        if os.path.exists(file_info["file_path"]):
-            os.remove(file_info["file_path"])
-        del uploaded_files[file_id]
+        forget_upload(file_id)
         
         return {
             "success": True,
@@ -1391,14 +1691,18 @@ async def delete_file(file_id: str, token: str = Depends(verify_token)):
 def cleanup_on_shutdown():
     """Clean up temporary directory on server shutdown"""
     try:
-        if os.path.exists(temp_dir):
+        # A shared UPLOAD_DIR is still in use by the other workers
+        if not UPLOAD_DIR and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
     except Exception as e:
         print(f"Error cleaning up temporary directory: {e}")
 
+# At exit rather than in the __main__ block, so uvicorn workers, bench.py and the tests remove theirs too
+atexit.register(cleanup_on_shutdown)
+
+startup_state["import_seconds"] = time.perf_counter() - _import_started
+metrics.STARTUP_SECONDS.set(startup_state["import_seconds"], phase="import")
+
 # %%
 if __name__ == "__main__":
-    try:
-        uvicorn.run(app, host="0.0.0.0", port=8000)
-    finally:
-        cleanup_on_shutdown()
+    uvicorn.run(app, host="0.0.0.0", port=8000)
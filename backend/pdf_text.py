@@ -0,0 +1,24 @@
+import io
+import os
+
+# Text extraction used by extract_property_info and extract_property_type. The regexes there
+# depend on PyPDF2's text layout: pypdf merges words and PyMuPDF orders lines differently, so
+# another library only goes in once tests/test_pdf_text.py passes with it.
+
+def _open_stream(source):
+    """Open a path, or wrap bytes / a memoryview of an in-memory PDF"""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb')
+    return io.BytesIO(source)
+
+def page_texts(source):
+    """Yield the text of each page, pages are only extracted as they are consumed"""
+    from PyPDF2 import PdfReader
+    with _open_stream(source) as stream:
+        for page in PdfReader(stream).pages:
+            yield page.extract_text()
+
+def page_count(source):
+    from PyPDF2 import PdfReader
+    with _open_stream(source) as stream:
+        return len(PdfReader(stream).pages)
@@ -0,0 +1,201 @@
+import cProfile
+import contextvars
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool as starlette_run_in_threadpool
+
+# Requests are profiled only when they carry the X-Profile header or ?profile= query flag
+# and an X-Admin-Key header matching PROFILE_ADMIN_KEY. Profiling is disabled when the key is unset.
+PROFILE_ADMIN_KEY = os.getenv("PROFILE_ADMIN_KEY", "")
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+# Seconds between stack samples in sample mode
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_MODES = ("sample", "cprofile")
+
+# Profiler of the request being handled. Context variables are copied into the threadpool, so the
+# work a request runs there through run_in_threadpool below finds its own request's profiler
+active_profiler = contextvars.ContextVar("active_profiler", default=None)
+# cProfile allows one active profiler per process on newer Pythons, so cprofile requests take turns
+cprofile_lock = threading.Lock()
+
+class StackSampler:
+    """
+    Sampling profiler that records the stacks of one request's threadpool threads at a fixed interval.
+
+    Other requests running meanwhile are left out, and so is the event loop, which interleaves every
+    request's coroutines. Writes collapsed stacks (frame;frame;frame count) that flamegraph.pl and
+    speedscope read directly.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_ids = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def enter_thread(self):
+        self.thread_ids.add(threading.get_ident())
+
+    def exit_thread(self):
+        self.thread_ids.discard(threading.get_ident())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+class ThreadProfiler:
+    """Deterministic cProfile of one request's threadpool work, one thread at a time"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.owner = None
+        self._lock = threading.Lock()
+
+    def enter_thread(self):
+        # A cProfile.Profile keeps a single call stack, so a second concurrent thread is not profiled
+        if self._lock.acquire(blocking=False):
+            self.owner = threading.get_ident()
+            self.profile.enable()
+
+    def exit_thread(self):
+        if self.owner == threading.get_ident():
+            self.profile.disable()
+            self.owner = None
+            self._lock.release()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+@contextmanager
+def profiled_thread():
+    """Include the current thread in the profile of the request that started this work, if it has one"""
+    profiler = active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    profiler.enter_thread()
+    try:
+        yield
+    finally:
+        profiler.exit_thread()
+
+async def run_in_threadpool(func, *args, **kwargs):
+    """Starlette's run_in_threadpool, with the work included in the current request's profile"""
+    def run():
+        with profiled_thread():
+            return func(*args, **kwargs)
+    return await starlette_run_in_threadpool(run)
+
+def requested_mode(scope):
+    """Profiling mode asked for by the request, or None when it did not ask"""
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.decode("latin-1").strip().lower() or "sample"
+    query_string = scope.get("query_string", b"")
+    if b"profile=" in query_string:
+        values = parse_qs(query_string.decode("latin-1")).get("profile")
+        if values:
+            return values[0].strip().lower() or "sample"
+    return None
+
+def is_admin(scope):
+    if not PROFILE_ADMIN_KEY:
+        return False
+    for name, value in scope["headers"]:
+        if name == b"x-admin-key":
+            return hmac.compare_digest(value, PROFILE_ADMIN_KEY.encode())
+    return False
+
+async def send_json(send, status, body):
+    payload = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles flagged requests and returns the profile ID in X-Profile-Id.
+
+    Modes:
+        sample    collapsed stacks of the request's threadpool threads, saved as <id>.folded
+        cprofile  deterministic cProfile of the request's threadpool work, saved as <id>.prof for pstats/snakeviz.
+                  One cprofile request runs at a time, others get a 409
+    Requests without the flag go straight to the app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        mode = requested_mode(scope)
+        if mode is None:
+            return await self.app(scope, receive, send)
+        if not is_admin(scope):
+            return await send_json(send, 403, {"detail": "Profiling requires an admin key"})
+        if mode not in PROFILE_MODES:
+            return await send_json(send, 400, {"detail": f"Unknown profile mode {mode}, use one of {', '.join(PROFILE_MODES)}"})
+
+        profile_id = f"prof_{uuid.uuid4().hex[:12]}"
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        if mode == "cprofile" and not cprofile_lock.acquire(blocking=False):
+            return await send_json(send, 409, {"detail": "Another cprofile request is running, try again when it has finished"})
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        start = time.perf_counter()
+        profiler = ThreadProfiler() if mode == "cprofile" else StackSampler()
+        token = active_profiler.set(profiler)
+        if mode == "sample":
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            active_profiler.reset(token)
+            if mode == "cprofile":
+                try:
+                    profiler.dump(os.path.join(PROFILES_DIR, f"{profile_id}.prof"))
+                finally:
+                    cprofile_lock.release()
+            else:
+                profiler.stop()
+                profiler.dump(os.path.join(PROFILES_DIR, f"{profile_id}.folded"))
+        print(f"Saved {mode} profile {profile_id} for {scope['path']} ({time.perf_counter() - start:.3f}s)")
@@ -0,0 +1,326 @@
+import io
+import os
+import pandas as pd
+from functools import lru_cache
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, Image, PageBreak
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+import metrics
+
+# Everything in this module that does not depend on the report data is built once at import
+# and shared by every report, so a render only pays for the tables and charts themselves.
+PAGE_MARGIN = 30
+AVAILABLE_WIDTH = letter[0] - 2 * PAGE_MARGIN
+AVAILABLE_HEIGHT = letter[1] - 2 * PAGE_MARGIN
+
+# Reports with at least this many properties switch to the large-report table layout
+LARGE_REPORT_ROWS = int(os.getenv("LARGE_REPORT_ROWS", "100"))
+# Smaller report files: charts are downsampled to REPORT_IMAGE_DPI at the size they are printed and
+# flattened onto white instead of carrying an alpha mask, and streams are not ASCII85 encoded
+REPORT_OPTIMIZE = os.getenv("REPORT_OPTIMIZE", "1") == "1"
+REPORT_IMAGE_DPI = int(os.getenv("REPORT_IMAGE_DPI", "200"))
+# ASCII85 makes every compressed stream a quarter larger for 7-bit safety PDFs no longer need.
+# It is a process-wide ReportLab setting, so it is set once here rather than per report while others render
+rl_config.useA85 = 0 if REPORT_OPTIMIZE else 1
+CHART_WIDTH = 7 * inch
+CHART_HEIGHT = 5 * inch
+
+styles = getSampleStyleSheet()
+
+# Styles for cells and table headers
+cell_style = ParagraphStyle(
+    name='Cell',
+    parent=styles['BodyText'],
+    fontName='Times-Roman',
+    fontSize=10,
+    leading=12,
+    spaceAfter=0,
+    spaceBefore=0,
+    wordWrap='CJK',
+    alignment=1
+)
+cell_heading_style = ParagraphStyle(
+    name='CellHeading',
+    fontName='Times-Bold',
+    fontSize=12,
+    leading=12,
+)
+title_style = ParagraphStyle(
+    name='Title',
+    parent=styles['Title'],
+    fontSize=24,
+    spaceAfter=30,
+    alignment=1
+)
+heading_style = ParagraphStyle(
+    name='Heading1',
+    parent=styles['Heading1'],
+    fontSize=18,
+    spaceAfter=12,
+    spaceBefore=12
+)
+subheading_style = styles['Heading2']
+bullet_style = ParagraphStyle(
+    name='Bullet',
+    parent=styles['BodyText'],
+    fontName='Times-Roman',
+    fontSize=12,
+    leading=12,
+    spaceAfter=0,
+)
+
+# Shared by the property and price tables
+comparison_table_style = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Times-Roman'),
+    ('FONTSIZE', (0, 0), (-1, 0), 9),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('FONTNAME', (0, 1), (0, -1), 'Times-Bold'),
+    ('FONTSIZE', (0, 1), (0, -1), 7),
+    ('BACKGROUND', (0, 1), (0, -1), colors.lightblue),
+    ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.beige, colors.white]),
+])
+
+# Large reports use plain strings wherever the text fits on one line, so body cells need
+# their fonts set on the table instead of through cell_style
+LARGE_BODY_FONT = ('Times-Roman', 8)
+LARGE_ADDRESS_FONT = ('Times-Bold', 7)
+LARGE_CELL_PADDING = 6  # default left+right padding ReportLab puts around a cell
+LARGE_ROW_HEIGHT = 14
+large_cell_style = ParagraphStyle(
+    name='LargeCell',
+    parent=cell_style,
+    fontSize=LARGE_BODY_FONT[1],
+    leading=LARGE_BODY_FONT[1] + 1,
+)
+large_table_style = TableStyle(comparison_table_style.getCommands() + [
+    ('FONTNAME', (1, 1), (-1, -1), LARGE_BODY_FONT[0]),
+    ('FONTSIZE', (1, 1), (-1, -1), LARGE_BODY_FONT[1]),
+    ('TOPPADDING', (0, 1), (-1, -1), 1),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 1),
+])
+
+# Column headers produced by extract_property_info and combine_to_dataframe
+PROPERTY_COLUMNS = ('Address', 'Status', 'Subdivision', 'Year Built', 'Living Sq Ft', 'Total Sq Ft',
+                    'Bedrooms', 'Bathrooms (Full)', 'Stories', 'Garage Spaces', 'Private Pool')
+PRICE_COLUMNS = ('Address', 'List Price', 'List $/Sq Ft (Living)', 'Sold Price', 'Sold $/Sq Ft (Living)', 'DOM')
+
+MIN_COL_WIDTH = 0.6 * inch
+MAX_COL_WIDTH = 2.2 * inch
+
+def header_width(header):
+    """Width a column needs for its header text, before any fitting to the page"""
+    padding = 12  # horizontal padding per cell (left+right)
+    w = stringWidth(str(header), cell_heading_style.fontName, cell_heading_style.fontSize) + 2 * padding
+    return max(MIN_COL_WIDTH, min(MAX_COL_WIDTH, w))
+
+@lru_cache(maxsize=32)
+def calc_col_widths(headers):
+    """Compute column widths from header text, fit to the available page width"""
+    raw_widths = [header_width(h) for h in headers]
+    total = sum(raw_widths) or 1.0
+    if total > AVAILABLE_WIDTH:
+        # Columns never go below MIN_COL_WIDTH, so tables with many columns need column_groups
+        scale = AVAILABLE_WIDTH / total
+        raw_widths = [max(MIN_COL_WIDTH, w * scale) for w in raw_widths]
+    return tuple(raw_widths)
+
+def column_groups(headers):
+    """
+    Split the columns of a table too wide for the page into groups that fit.
+
+    Returns:
+        list: Column positions per group, each starting with the first (address) column
+    """
+    first_width = header_width(headers[0])
+    groups = [[0]]
+    width = first_width
+    for position, header in enumerate(headers[1:], start=1):
+        column_width = header_width(header)
+        if width + column_width > AVAILABLE_WIDTH and len(groups[-1]) > 1:
+            groups.append([0])
+            width = first_width
+        groups[-1].append(position)
+        width += column_width
+    return groups
+
+# Warm the width cache for the two standard tables
+calc_col_widths(PROPERTY_COLUMNS)
+calc_col_widths(PRICE_COLUMNS)
+metrics.register_lru_cache("column_widths", calc_col_widths)
+
+def build_table(df):
+    """Turn a dataframe into a styled comparison table, one Paragraph per cell for word wrapping"""
+    headers = tuple(str(col) for col in df.columns)
+    data = [[Paragraph(header, cell_heading_style) for header in headers]]
+    for row in df.itertuples(index=False, name=None):
+        data.append([Paragraph(str(cell) if pd.notna(cell) else '', cell_style) for cell in row])
+    table = Table(data, colWidths=list(calc_col_widths(headers)))
+    table.setStyle(comparison_table_style)
+    return table
+
+def large_rows_per_chunk():
+    """Number of single-line rows (plus the header) that fit on one page"""
+    header_height = 3 * cell_heading_style.leading + 15  # headers wrap to at most three lines
+    return max(1, int((AVAILABLE_HEIGHT - header_height) // LARGE_ROW_HEIGHT))
+
+def build_large_tables(df):
+    """
+    Lay out a dataframe with many rows as a series of fixed-height long tables.
+
+    Rows are cut into page-sized chunks so ReportLab never has to split one huge table,
+    each chunk repeats the header row if it does spill onto a new page, and cells are
+    plain strings unless the text is too wide for its column.
+    """
+    headers = tuple(str(col) for col in df.columns)
+    col_widths = calc_col_widths(headers)
+    rows_per_chunk = large_rows_per_chunk()
+    tables = []
+    for start in range(0, len(df), rows_per_chunk):
+        data = [[Paragraph(header, cell_heading_style) for header in headers]]
+        for row in df.iloc[start:start + rows_per_chunk].itertuples(index=False, name=None):
+            cells = []
+            for j, cell in enumerate(row):
+                text = str(cell) if pd.notna(cell) else ''
+                font_name, font_size = LARGE_ADDRESS_FONT if j == 0 else LARGE_BODY_FONT
+                if stringWidth(text, font_name, font_size) + LARGE_CELL_PADDING <= col_widths[j]:
+                    cells.append(text)
+                else:
+                    cells.append(Paragraph(text, large_cell_style))
+            data.append(cells)
+        table = LongTable(data, colWidths=list(col_widths), repeatRows=1)
+        table.setStyle(large_table_style)
+        tables.append(table)
+    return tables
+
+def amenity_tables(amenity_df, build_tables=lambda df: [build_table(df)]):
+    """Amenity Comparison tables, one per group of amenity columns that fits the page width"""
+    table_df = amenity_df.copy()
+    for column in table_df.columns[1:]:
+        table_df[column] = table_df[column].map({True: "Yes", False: ""})
+    tables = []
+    for group in column_groups(tuple(str(column) for column in table_df.columns)):
+        if tables:
+            tables.append(Spacer(1, 12))
+        tables.extend(build_tables(table_df.iloc[:, group]))
+    return tables
+
+@lru_cache(maxsize=16)
+def downsample_chart(data, dpi):
+    """
+    Chart PNG resized to CHART_WIDTH x CHART_HEIGHT at dpi, as RGB PNG bytes.
+
+    Cached on the PNG bytes, so a chart that several reports share (see chart_cache) is only resized once.
+    """
+    from PIL import Image as PILImage
+    size = (round(CHART_WIDTH / inch * dpi), round(CHART_HEIGHT / inch * dpi))
+    with PILImage.open(io.BytesIO(data)) as image:
+        image = image.convert("RGBA")
+        if image.width > size[0] or image.height > size[1]:
+            image = image.resize(size, PILImage.LANCZOS)
+        flattened = PILImage.new("RGB", image.size, "white")
+        flattened.paste(image, mask=image.getchannel("A"))
+    buffer = io.BytesIO()
+    flattened.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+metrics.register_lru_cache("report_images", downsample_chart)
+
+def chart_image(path, optimize):
+    if not optimize:
+        return Image(path, width=CHART_WIDTH, height=CHART_HEIGHT)
+    with open(path, "rb") as file:
+        data = file.read()
+    optimized = downsample_chart(data, REPORT_IMAGE_DPI)
+    metrics.REPORT_IMAGE_BYTES.inc(len(data), stage="before")
+    metrics.REPORT_IMAGE_BYTES.inc(len(optimized), stage="after")
+    # ReportLab names in-memory image XObjects after a digest of their pixels, so a chart drawn twice is stored once
+    return Image(io.BytesIO(optimized), width=CHART_WIDTH, height=CHART_HEIGHT)
+
+def render_report(output_path, property_df, price_df, appraisal_report, price_chart_path=None, sqft_chart_path=None, check=None,
+                  optimize=None, amenity_df=None):
+    """
+    Render the property comparison PDF.
+
+    Args:
+        output_path (str): Where to write the PDF
+        property_df (DataFrame): Property features, subject property first
+        price_df (DataFrame): Price information, subject property first
+        appraisal_report (list): Appraisal bullet points
+        price_chart_path (str): List vs sold price chart, skipped if missing
+        sqft_chart_path (str): $/sq ft chart, skipped if missing
+        check (callable): Called between flowables, raise from it to stop the build
+        optimize (bool): Downsample charts, defaults to REPORT_OPTIMIZE. ASCII85 follows REPORT_OPTIMIZE only
+        amenity_df (DataFrame): Address plus one boolean column per amenity, see AmenityTagger.matrix
+    """
+    optimize = REPORT_OPTIMIZE if optimize is None else optimize
+    doc = SimpleDocTemplate(output_path, pagesize=letter, topMargin=PAGE_MARGIN, bottomMargin=PAGE_MARGIN,
+                            leftMargin=PAGE_MARGIN, rightMargin=PAGE_MARGIN, pageCompression=1)
+
+    # Build PDF story
+    if len(property_df) >= LARGE_REPORT_ROWS:
+        build_tables = build_large_tables
+    else:
+        build_tables = lambda df: [build_table(df)]
+    property_tables = build_tables(property_df)
+    price_tables = build_tables(price_df)
+    story = [
+        Paragraph("Property Comparison Analysis", title_style),
+        Spacer(1, 20),
+        Paragraph("Property Features Comparison", heading_style),
+        *property_tables,
+        Spacer(1, 30),
+        Paragraph("Price & Market Analysis", heading_style),
+        *price_tables,
+    ]
+    if amenity_df is not None and len(amenity_df.columns) > 1:
+        story += [
+            Spacer(1, 30),
+            Paragraph("Amenity Comparison", heading_style),
+            *amenity_tables(amenity_df, build_tables),
+        ]
+    story += [
+        PageBreak(),
+        Paragraph("List Price vs Sold Price", heading_style),
+    ]
+
+    # Add graphs
+    try:
+        if price_chart_path and os.path.exists(price_chart_path):
+            story.append(chart_image(price_chart_path, optimize))
+            story.append(Spacer(1, 10))
+
+        if sqft_chart_path and os.path.exists(sqft_chart_path):
+            story.append(PageBreak())
+            story.append(Paragraph("List $/Sq Ft vs Sold $/Sq Ft", heading_style))
+            story.append(chart_image(sqft_chart_path, optimize))
+    except Exception as e:
+        print(f"Error adding graphs to PDF: {e}")
+
+    # Add appraisal report
+    story.append(PageBreak())
+    story.append(Paragraph("Appraisal Report", heading_style))
+    story.append(Paragraph("From a comparative market analysis viewpoint:", subheading_style))
+    story.append(Spacer(1, 10))
+    for item in appraisal_report or []:
+        story.append(Paragraph(f"• {item}", bullet_style))
+        story.append(Spacer(1, 6))
+
+    # Build the PDF
+    if check is not None:
+        # Called after every flowable is laid out, check raises to abandon the build
+        doc.afterFlowable = check
+    with metrics.stage_timer("doc_build"):
+        doc.build(story)
+    metrics.REPORT_BYTES.observe(os.path.getsize(output_path), optimized=str(optimize).lower())
+    return output_path
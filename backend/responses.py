@@ -0,0 +1,45 @@
+import json
+
+from fastapi.responses import JSONResponse
+
+# orjson is optional: it is several times faster than the standard library encoder and
+# serializes numpy arrays and scalars natively. Without it responses fall back to json.dumps.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATAFRAME_ORIENTS = ("columns", "records")
+
+def _default(value):
+    """Encode the values neither encoder knows: numpy scalars, pandas timestamps and NA markers"""
+    import pandas as pd
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "tolist"):
+        # numpy scalars and arrays
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed"""
+
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def dataframe_payload(df, orient="columns"):
+    """
+    DataFrame as JSON-ready data with missing values shown as 'N/A'.
+
+    Args:
+        orient (str): "columns" for {column: {row: value}}, "records" for [{column: value}, ...]
+    """
+    # One vectorized pass instead of checking every cell with pd.isna
+    df = df.astype(object).where(df.notna(), 'N/A')
+    if orient == "records":
+        return df.to_dict(orient="records")
+    return df.to_dict()
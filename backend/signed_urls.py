@@ -0,0 +1,46 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+# Report view/download links are signed with HMAC-SHA256 so the PDF viewer never needs the
+# Cognito JWT in its URL. REPORT_URL_SECRET should be set when running more than one worker
+# without a shared state store; otherwise a random secret is generated once and kept in the store.
+REPORT_URL_SECRET = os.getenv("REPORT_URL_SECRET")
+# How long an issued link stays valid
+REPORT_URL_TTL = int(os.getenv("REPORT_URL_TTL", "300"))
+
+class ReportUrlSigner:
+    """Issues and checks expiring, report-scoped link signatures"""
+
+    def __init__(self, state_namespace, secret=REPORT_URL_SECRET, ttl=REPORT_URL_TTL):
+        self.state_namespace = state_namespace
+        self.ttl = ttl
+        self._secret = secret.encode() if secret else None
+
+    @property
+    def secret(self):
+        if self._secret is None:
+            # Generated by whichever worker gets here first, the atomic update keeps the others on the same one
+            stored = self.state_namespace.update_value(
+                "report_url_secret", lambda current: current or secrets.token_hex(32)
+            )
+            self._secret = stored.encode()
+        return self._secret
+
+    def signature(self, report_id, action, expires):
+        message = f"{action}:{report_id}:{expires}".encode()
+        digest = hmac.new(self.secret, message, hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def sign(self, report_id, action):
+        """Query parameters for a link to one report action ("view" or "download")"""
+        expires = int(time.time()) + self.ttl
+        return {"expires": expires, "sig": self.signature(report_id, action, expires)}
+
+    def verify(self, report_id, action, expires, signature):
+        if expires is None or not signature or expires < time.time():
+            return False
+        return hmac.compare_digest(self.signature(report_id, action, expires), signature)
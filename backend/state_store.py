@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+# Shared state for upload records, parse results and report jobs.
+# STATE_BACKEND=memory keeps everything in this process (single worker only).
+# STATE_BACKEND=sqlite keeps it in STATE_DB_PATH so every uvicorn worker, or every pod on a
+# shared volume, sees the same uploads. Values must be JSON serializable.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.sqlite3")
+
+class MemoryStateStore:
+    """State kept in a dict per namespace, only visible to the current process"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            return self._data.get(namespace, {}).get(key, default)
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = value
+
+    def delete(self, namespace, key):
+        with self._lock:
+            return self._data.get(namespace, {}).pop(key, None) is not None
+
+    def contains(self, namespace, key):
+        with self._lock:
+            return key in self._data.get(namespace, {})
+
+    def keys(self, namespace):
+        with self._lock:
+            return list(self._data.get(namespace, {}))
+
+    def items(self, namespace):
+        with self._lock:
+            return list(self._data.get(namespace, {}).items())
+
+    def count(self, namespace):
+        with self._lock:
+            return len(self._data.get(namespace, {}))
+
+    def clear(self, namespace):
+        with self._lock:
+            self._data.pop(namespace, None)
+
+    def iter_batches(self, namespace, batch_size=500):
+        """Yield the items of a namespace in lists of at most batch_size, without copying them all at once"""
+        keys = self.keys(namespace)
+        for start in range(0, len(keys), batch_size):
+            with self._lock:
+                values = self._data.get(namespace, {})
+                # Keys deleted since the snapshot are skipped
+                batch = [(key, values[key]) for key in keys[start:start + batch_size] if key in values]
+            if batch:
+                yield batch
+
+    def update(self, namespace, key, func, default=None):
+        """Atomically replace a value with func(current value) and return the new value"""
+        with self._lock:
+            values = self._data.setdefault(namespace, {})
+            values[key] = func(values.get(key, default))
+            return values[key]
+
+class SQLiteStateStore:
+    """State kept in a SQLite database shared by every process that opens the same file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    def _connection(self):
+        # One connection per thread, in autocommit mode so update() can manage its own transaction
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._connection().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+            (namespace, key, json.dumps(value))
+        )
+
+    def delete(self, namespace, key):
+        cursor = self._connection().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+        return cursor.rowcount > 0
+
+    def contains(self, namespace, key):
+        return self._connection().execute(
+            "SELECT 1 FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone() is not None
+
+    def keys(self, namespace):
+        rows = self._connection().execute("SELECT key FROM state WHERE namespace = ? ORDER BY rowid", (namespace,))
+        return [row[0] for row in rows]
+
+    def items(self, namespace):
+        rows = self._connection().execute("SELECT key, value FROM state WHERE namespace = ? ORDER BY rowid", (namespace,))
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def count(self, namespace):
+        return self._connection().execute("SELECT COUNT(*) FROM state WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def clear(self, namespace):
+        self._connection().execute("DELETE FROM state WHERE namespace = ?", (namespace,))
+
+    def iter_batches(self, namespace, batch_size=500):
+        """Yield the items of a namespace in lists of at most batch_size, paging by rowid"""
+        last_rowid = 0
+        while True:
+            rows = self._connection().execute(
+                "SELECT rowid, key, value FROM state WHERE namespace = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                (namespace, last_rowid, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [(key, json.loads(value)) for _, key, value in rows]
+
+    def update(self, namespace, key, func, default=None):
+        """Atomically replace a value with func(current value) and return the new value"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            value = func(json.loads(row[0]) if row else default)
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, key, json.dumps(value))
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+class StateNamespace(MutableMapping):
+    """
+    Dict view of one namespace in a state store.
+
+    Values are stored as a whole: changing a nested value in place does not persist,
+    assign the updated record back instead.
+    """
+
+    def __init__(self, store, namespace):
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key):
+        value = self.store.get(self.namespace, key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.namespace, key, value)
+
+    def __delitem__(self, key):
+        if not self.store.delete(self.namespace, key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.store.contains(self.namespace, key)
+
+    def __iter__(self):
+        return iter(self.store.keys(self.namespace))
+
+    def __len__(self):
+        return self.store.count(self.namespace)
+
+    def items(self):
+        return self.store.items(self.namespace)
+
+    def values(self):
+        return [value for _, value in self.store.items(self.namespace)]
+
+    def clear(self):
+        self.store.clear(self.namespace)
+
+    def iter_batches(self, batch_size=500):
+        return self.store.iter_batches(self.namespace, batch_size)
+
+    def update_value(self, key, func, default=None):
+        return self.store.update(self.namespace, key, func, default)
+
+_missing = object()
+
+def create_state_store(backend=STATE_BACKEND, path=STATE_DB_PATH):
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore(path)
+    raise ValueError(f"Unknown STATE_BACKEND {backend}, use memory or sqlite")
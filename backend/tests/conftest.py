@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUTS_DIR = os.path.join(BACKEND_DIR, "..", "inputs")
+
+# The backend modules import each other by name and write reports/ relative to the working directory
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+def input_pdfs():
+    return sorted(
+        os.path.join(INPUTS_DIR, name) for name in os.listdir(INPUTS_DIR) if name.lower().endswith(".pdf")
+    )
+
+@pytest.fixture(scope="session")
+def residential_pdfs():
+    import pdf_handle
+    residential = [path for path in input_pdfs() if pdf_handle.extract_property_type(path) == "Residential"]
+    if len(residential) < 2:
+        pytest.skip("Need at least two residential PDFs in inputs/")
+    return residential
+
+@pytest.fixture
+def client():
+    """Test client with Cognito auth stubbed out"""
+    from fastapi.testclient import TestClient
+    import pdf_handle
+    from middleware import verify_token
+    pdf_handle.app.dependency_overrides[verify_token] = lambda: "test"
+    with TestClient(pdf_handle.app) as test_client:
+        yield test_client
+    pdf_handle.app.dependency_overrides.pop(verify_token, None)
+
+def upload_flow(client, subject, comps):
+    """Upload a subject and its comparables, returning (input file ID, comparison file IDs)"""
+    with open(subject, "rb") as file:
+        response = client.post("/upload-input-pdf", files={"file": (os.path.basename(subject), file, "application/pdf")})
+    response.raise_for_status()
+    input_id = response.json()["file_id"]
+    handles = [open(path, "rb") for path in comps]
+    try:
+        response = client.post("/upload-comparison-pdf", files=[
+            ("files", (os.path.basename(path), handle, "application/pdf")) for path, handle in zip(comps, handles)
+        ])
+    finally:
+        for handle in handles:
+            handle.close()
+    response.raise_for_status()
+    return input_id, [uploaded["file_id"] for uploaded in response.json()["uploaded_files"]]
@@ -0,0 +1,61 @@
+import socket
+import threading
+import time
+
+import uvicorn
+
+import metrics
+import pdf_handle
+from cancellation import JobCancelled
+from middleware import verify_token
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_client_disconnect_cancels_build(monkeypatch):
+    started = threading.Event()
+    outcome = {}
+
+    def slow_build(*args, cancel):
+        started.set()
+        try:
+            with cancel.stage("parse"):
+                for _ in range(200):
+                    cancel.check()
+                    time.sleep(0.05)
+            outcome["result"] = "finished"
+        except JobCancelled as e:
+            outcome["result"] = e.reason
+            raise
+
+    monkeypatch.setattr(pdf_handle, "build_uploaded_report", slow_build)
+    monkeypatch.setitem(pdf_handle.app.dependency_overrides, verify_token, lambda: "test")
+    labels = ("client_disconnected", "parse")
+    cancelled_before = metrics.JOBS_CANCELLED.values.get(labels, 0)
+
+    # A real server, so the disconnect goes through the whole middleware stack as it does in production
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(pdf_handle.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not server.started and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert server.started
+
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            sock.sendall(b"GET /generate-report?input_file=a&comparison_files=b HTTP/1.1\r\nHost: test\r\n\r\n")
+            assert started.wait(5)
+        # The build polls its checkpoints every 50 ms, well inside the 10 s it would otherwise run
+        deadline = time.monotonic() + 5
+        while "result" not in outcome and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        server.should_exit = True
+        thread.join(10)
+
+    assert outcome.get("result") == "client_disconnected"
+    assert metrics.JOBS_CANCELLED.values.get(labels, 0) == cancelled_before + 1
@@ -0,0 +1,31 @@
+import csv
+import io
+import os
+import subprocess
+import sys
+
+import pdf_handle
+from conftest import BACKEND_DIR, INPUTS_DIR, upload_flow
+
+def test_export_keeps_listings_after_report(client):
+    subject = os.path.join(INPUTS_DIR, "WindsorPark.pdf")
+    comps = [os.path.join(INPUTS_DIR, "Lamarville.pdf")]
+    input_id, comp_ids = upload_flow(client, subject, comps)
+    response = client.get("/generate-report", params={"input_file": input_id, "comparison_files": ",".join(comp_ids)})
+    assert response.status_code == 200
+    os.remove(os.path.join(pdf_handle.reports_dir, f"{response.json()['report_id']}.pdf"))
+    # The report removed the uploads and their parse results
+    assert input_id not in pdf_handle.uploaded_files
+
+    response = client.get("/export/listings", params={"format": "csv", "subdivision": "Windsor Park"})
+    assert response.status_code == 200
+    addresses = {row["address"] for row in csv.DictReader(io.StringIO(response.text))}
+    assert "1163 N Prescott Drive" in addresses
+
+def test_cli_refuses_an_empty_memory_store(tmp_path):
+    output = tmp_path / "listings.csv"
+    env = {**os.environ, "STATE_BACKEND": "memory"}
+    result = subprocess.run([sys.executable, "listing_export.py", "--format", "csv", "--output", str(output)],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 1
+    assert not output.exists()
@@ -0,0 +1,16 @@
+import os
+
+import pdf_handle
+from conftest import INPUTS_DIR
+from market_stats import MarketStats
+from state_store import MemoryStateStore
+
+def test_listing_in_two_pdfs_is_counted_once():
+    stats = MarketStats(MemoryStateStore())
+    # Two exports of the same four listings, so their content hashes differ
+    stats.record("windsor", pdf_handle.extract_property_info(os.path.join(INPUTS_DIR, "WindsorPark.pdf")))
+    counted = stats.lookup("Windsor Park")["count"]
+    stats.record("flexmls", pdf_handle.extract_property_info(os.path.join(INPUTS_DIR, "Residential _ flexmls Web.pdf")))
+
+    assert counted == 2
+    assert stats.lookup("Windsor Park")["count"] == counted
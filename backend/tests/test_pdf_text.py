@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+import pdf_handle
+from conftest import INPUTS_DIR, input_pdfs
+
+EXPECTED_PATH = os.path.join(os.path.dirname(__file__), "data", "expected_fields.json")
+
+with open(EXPECTED_PATH) as file:
+    EXPECTED = json.load(file)
+
+def canonical(value):
+    # Tuples become lists and NaN never equals itself, so compare the JSON form of the extracted values
+    return json.loads(json.dumps(value, default=str))
+
+def test_every_sample_has_expected_fields():
+    assert sorted(os.path.basename(path) for path in input_pdfs()) == sorted(EXPECTED)
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_extraction_matches_expected_fields(name):
+    """Regenerate data/expected_fields.json only after checking the new values by hand"""
+    assert canonical(pdf_handle.extract_property_info(os.path.join(INPUTS_DIR, name))) == EXPECTED[name]
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_extraction_from_memory_matches_file(name):
+    path = os.path.join(INPUTS_DIR, name)
+    with open(path, "rb") as file:
+        data = file.read()
+    assert canonical(pdf_handle.extract_property_info(data)) == canonical(pdf_handle.extract_property_info(path))
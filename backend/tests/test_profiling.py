@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import profiling
+from profiling import ProfilingMiddleware, StackSampler, active_profiler, run_in_threadpool
+
+def test_sampler_only_records_the_requests_threads():
+    sampler = StackSampler(interval=0.001)
+    other_running = threading.Event()
+    stop = threading.Event()
+
+    def other_request_work():
+        other_running.set()
+        stop.wait(5)
+
+    def this_request_work():
+        stop.wait(0.2)
+
+    async def handle():
+        token = active_profiler.set(sampler)
+        try:
+            await run_in_threadpool(this_request_work)
+        finally:
+            active_profiler.reset(token)
+
+    other = threading.Thread(target=other_request_work)
+    other.start()
+    other_running.wait(5)
+    sampler.start()
+    try:
+        asyncio.run(handle())
+    finally:
+        sampler.stop()
+        stop.set()
+        other.join()
+
+    assert sampler.stacks
+    assert all("this_request_work" in stack for stack in sampler.stacks)
+
+def test_concurrent_cprofile_request_is_rejected(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_KEY", "admin")
+    monkeypatch.setattr(profiling, "PROFILES_DIR", str(tmp_path))
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = ProfilingMiddleware(app)
+    scope = {"type": "http", "path": "/", "query_string": b"",
+             "headers": [(b"x-profile", b"cprofile"), (b"x-admin-key", b"admin")]}
+
+    async def request(statuses):
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+        await middleware(scope, None, send)
+
+    async def main():
+        first, second = [], []
+        running = asyncio.ensure_future(request(first))
+        await asyncio.sleep(0)
+        await request(second)
+        release.set()
+        await running
+        # Once the first has finished the next cprofile request is accepted again
+        third = []
+        await request(third)
+        return first, second, third
+
+    assert asyncio.run(main()) == ([200], [409], [200])
+    assert len(list(tmp_path.glob("*.prof"))) == 2
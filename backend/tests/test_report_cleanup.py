@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pdf_handle
+from conftest import upload_flow
+
+def generate(client, input_id, comp_ids):
+    response = client.get("/generate-report", params={"input_file": input_id, "comparison_files": ",".join(comp_ids)})
+    if response.status_code == 200:
+        os.remove(os.path.join(pdf_handle.reports_dir, f"{response.json()['report_id']}.pdf"))
+    return response
+
+def test_report_keeps_other_flows_uploads(client, residential_pdfs):
+    subject, comps = residential_pdfs[0], residential_pdfs[1:]
+    first = upload_flow(client, subject, comps)
+    second = upload_flow(client, subject, comps)
+
+    assert generate(client, *first).status_code == 200
+    # The first report only removed its own uploads
+    assert second[0] in pdf_handle.uploaded_files
+    assert first[0] not in pdf_handle.uploaded_files
+    assert pdf_handle.session_state.get("input_file_id") == second[0]
+    assert generate(client, *second).status_code == 200
+
+def test_concurrent_reports(client, residential_pdfs):
+    subject, comps = residential_pdfs[0], residential_pdfs[1:]
+    flows = [upload_flow(client, subject, comps) for _ in range(3)]
+
+    with ThreadPoolExecutor(len(flows)) as executor:
+        responses = list(executor.map(lambda flow: generate(client, *flow), flows))
+
+    assert [response.status_code for response in responses] == [200] * len(flows)
+    for input_id, comp_ids in flows:
+        assert input_id not in pdf_handle.uploaded_files
+        assert not any(comp_id in pdf_handle.uploaded_files for comp_id in comp_ids)
+
+def test_last_report_using_an_upload_removes_it(client, residential_pdfs):
+    input_id, comp_ids = upload_flow(client, residential_pdfs[0], residential_pdfs[1:2])
+    first = pdf_handle.claim_files([input_id, *comp_ids])
+    second = pdf_handle.claim_files([input_id])
+
+    pdf_handle.release_files(first, remove=True)
+    # Still claimed by the second report
+    assert input_id in pdf_handle.uploaded_files
+    assert comp_ids[0] not in pdf_handle.uploaded_files
+
+    pdf_handle.release_files(second, remove=True)
+    assert input_id not in pdf_handle.uploaded_files
+    assert pdf_handle.claim_files([input_id]) == []
+    assert input_id not in pdf_handle.active_files
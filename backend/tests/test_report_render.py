@@ -0,0 +1,28 @@
+import io
+
+import pandas as pd
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table
+
+from amenity_tagger import DEFAULT_VOCABULARY, AmenityTagger
+from report_render import AVAILABLE_HEIGHT, PAGE_MARGIN, amenity_tables
+
+def frame_width():
+    return SimpleDocTemplate(io.BytesIO(), pagesize=letter, leftMargin=PAGE_MARGIN, rightMargin=PAGE_MARGIN).width
+
+def test_amenity_tables_fit_the_page_with_every_amenity():
+    columns = {"Address": ["1 Subject Way", "2 Comparable Court"]}
+    columns.update({amenity: [True, False] for amenity in DEFAULT_VOCABULARY})
+    tables = [flowable for flowable in amenity_tables(pd.DataFrame(columns)) if isinstance(flowable, Table)]
+
+    assert len(tables) > 1
+    for table in tables:
+        width, _ = table.wrap(frame_width(), AVAILABLE_HEIGHT)
+        assert width <= frame_width()
+    # Every amenity is shown once, each group next to the address column
+    assert sum(table._ncols - 1 for table in tables) == len(DEFAULT_VOCABULARY)
+
+def test_hvac_heat_pump_is_not_pool_heat():
+    tagger = AmenityTagger(DEFAULT_VOCABULARY)
+    assert "Pool Heat" not in tagger.tag({"Interior": "New AC with a heat pump in 2022"})
+    assert "Pool Heat" in tagger.tag({"Exterior": "Pool heat pump and paver deck"})
@@ -0,0 +1,42 @@
+import os
+
+import pdf_handle
+from conftest import INPUTS_DIR, upload_flow
+
+def sample(name):
+    return os.path.join(INPUTS_DIR, name)
+
+def generate(client, input_id, comp_ids, session_id=None):
+    params = {"input_file": input_id, "comparison_files": ",".join(comp_ids)}
+    if session_id:
+        params["session_id"] = session_id
+    response = client.get("/generate-report", params=params)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    os.remove(os.path.join(pdf_handle.reports_dir, f"{body['report_id']}.pdf"))
+    return body
+
+def test_session_average_matches_fresh_report(client):
+    # WindsorPark.pdf holds four listings, the three after the first are comparables as well
+    comps = [sample("Lamarville.pdf"), sample("1245 Bourne Drive, Jupiter, Fl _ MLS #RX-1107986.pdf")]
+    input_id, comp_ids = upload_flow(client, sample("WindsorPark.pdf"), comps)
+
+    session = generate(client, input_id, comp_ids, session_id="averages")
+    fresh = generate(client, input_id, comp_ids)
+    client.delete("/sessions/averages")
+
+    assert session["report_data"]["appraisal_report"][:2] == fresh["report_data"]["appraisal_report"][:2]
+
+def test_new_subject_releases_previous_uploads(client):
+    comps = [sample("Lamarville.pdf")]
+    first_input, first_comps = upload_flow(client, sample("WindsorPark.pdf"), comps)
+    generate(client, first_input, first_comps, session_id="switch")
+    second_input, second_comps = upload_flow(client, sample("Residential _ flexmls Web.pdf"), comps)
+    generate(client, second_input, second_comps, session_id="switch")
+
+    assert first_input not in pdf_handle.uploaded_files
+    assert first_comps[0] not in pdf_handle.uploaded_files
+    assert second_input in pdf_handle.uploaded_files
+
+    client.delete("/sessions/switch")
+    assert second_input not in pdf_handle.uploaded_files
@@ -0,0 +1,26 @@
+from conftest import upload_flow
+from text_similarity import rank_comparables, top_terms
+
+def test_top_terms_breaks_ties_by_term():
+    vector = {"pool": 0.5, "dock": 0.5, "garage": 0.5, "lanai": 0.7}
+    assert top_terms(vector, {"pool", "garage", "dock", "lanai"}, 3) == ["lanai", "dock", "garage"]
+
+def test_rank_comparables_most_similar_first():
+    rows = [
+        {"Address": "subject", "Public Remarks": "Heated pool with a boat dock on the canal"},
+        {"Address": "unrelated", "Public Remarks": "Two car garage and tile roof"},
+        {"Address": "similar", "Public Remarks": "Boat dock on the canal and a heated pool"},
+    ]
+    ranking = rank_comparables(rows)
+    assert [item["address"] for item in ranking] == ["similar", "unrelated"]
+    assert ranking[0]["shared_terms"] == sorted(ranking[0]["shared_terms"])
+
+def test_similar_comparables_lists_missing_files(client, residential_pdfs):
+    input_id, comp_ids = upload_flow(client, residential_pdfs[0], residential_pdfs[1:3])
+    response = client.get("/similar-comparables", params={
+        "input_file": input_id, "comparison_files": ",".join([*comp_ids, "purged-file-id"])
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["missing"] == ["purged-file-id"]
+    assert {item["file_id"] for item in body["comparables"]} <= set(comp_ids)
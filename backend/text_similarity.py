@@ -0,0 +1,83 @@
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+import metrics
+
+# Offline TF-IDF similarity between the subject and its comparables over the listing remarks.
+# Each listing's term counts are cached on its text, so only the IDF weighting (a pass over a few
+# hundred terms) is redone when the comparison set changes.
+FEATURE_TEXT_FIELDS = ("Interior", "Exterior", "Public Remarks")
+
+# Common English and MLS boilerplate words that say nothing about a property
+STOPWORDS = frozenset("""
+a about all also an and any are as at be been but by can for from has have in into is it its
+more most new no not of on or our over so such than that the their there these this to up very
+was were will with you your home property features feature room rooms
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9]+")
+
+def listing_text(features_info, fields):
+    """The listing's text fields joined into one string, also used by amenity_tagger"""
+    # Missing fields are None from the parser and NaN once they have been through a DataFrame
+    return " ".join(value for value in (features_info.get(field) for field in fields) if isinstance(value, str))
+
+@lru_cache(maxsize=4096)
+def term_counts(text):
+    """Sparse term frequency vector of one listing's text as {term: count}"""
+    return dict(Counter(token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS))
+
+metrics.register_lru_cache("listing_terms", term_counts)
+
+def tfidf_vectors(texts):
+    """L2 normalized TF-IDF vectors, with smoothed IDF computed over these texts only"""
+    counts = [term_counts(text) for text in texts]
+    document_frequency = Counter(term for count in counts for term in count)
+    total = len(counts)
+    idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+    vectors = []
+    for count in counts:
+        vector = {term: (1 + math.log(tf)) * idf[term] for term, tf in count.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        vectors.append({term: weight / norm for term, weight in vector.items()} if norm else {})
+    return vectors
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b[term] for term, weight in a.items() if term in b)
+
+def top_terms(vector, terms, limit):
+    # Ties are broken alphabetically, set iteration order changes between processes
+    return sorted(terms, key=lambda term: (-vector[term], term))[:limit]
+
+def rank_comparables(features_rows, limit=5):
+    """
+    Rank the comparables by how similar their remarks are to the subject's.
+
+    Args:
+        features_rows (list): features_info dicts, subject first
+        limit (int): Shared and distinguishing terms returned per comparable
+
+    Returns:
+        list: {"index", "address", "similarity", "shared_terms", "distinct_terms"} per comparable, most similar first.
+            "index" is the comparable's position in features_rows
+    """
+    if len(features_rows) < 2:
+        return []
+    vectors = tfidf_vectors([listing_text(row, FEATURE_TEXT_FIELDS) for row in features_rows])
+    subject = vectors[0]
+    ranking = []
+    for index, (row, vector) in enumerate(zip(features_rows[1:], vectors[1:]), start=1):
+        ranking.append({
+            "index": index,
+            "address": row.get("Address"),
+            "similarity": round(cosine(subject, vector), 4),
+            # Shared terms ranked by their weight in the comparable, distinct ones are absent from the subject
+            "shared_terms": top_terms(vector, vector.keys() & subject.keys(), limit),
+            "distinct_terms": top_terms(vector, vector.keys() - subject.keys(), limit),
+        })
+    ranking.sort(key=lambda item: -item["similarity"])
+    return ranking
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import zipfile
+from fastapi import HTTPException
+from profiling import run_in_threadpool
+
+# Uploads are copied in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Largest accepted upload in bytes
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(25 * 1024 * 1024)))
+# ZIP uploads: most members per archive, and most bytes decompressed from one archive
+ZIP_MAX_MEMBERS = int(os.getenv("ZIP_MAX_MEMBERS", "200"))
+ZIP_MAX_TOTAL_SIZE = int(os.getenv("ZIP_MAX_TOTAL_SIZE", str(500 * 1024 * 1024)))
+# PDFs barely compress, a member that expands more than this many times is treated as a zip bomb
+ZIP_MAX_RATIO = float(os.getenv("ZIP_MAX_RATIO", "100"))
+# Uploads up to this many bytes are held in memory and parsed from there, larger ones are streamed to disk
+IN_MEMORY_UPLOAD_MAX = int(os.getenv("IN_MEMORY_UPLOAD_MAX", str(8 * 1024 * 1024)))
+
+def is_pdf_header(chunk):
+    """PDF readers accept the %PDF- marker anywhere in the first 1024 bytes"""
+    return b"%PDF-" in chunk[:1024]
+
+def _write_chunk(buffer, digest, chunk):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+async def save_upload(file, file_path, max_size=MAX_FILE_SIZE, head=b""):
+    """
+    Stream an uploaded file to disk without blocking the event loop.
+
+    The sha256 of the content is computed during the copy, the first chunk must contain
+    a PDF header and the copy is aborted as soon as the file grows past max_size.
+    A partially written file is removed before the error is raised.
+
+    Args:
+        file (UploadFile): File from the request
+        file_path (str): Destination path
+        max_size (int): Maximum size in bytes
+        head (bytes): Start of the file already read and checked by read_upload
+
+    Returns:
+        tuple: (size in bytes, sha256 hex digest)
+    """
+    digest = hashlib.sha256()
+    size = len(head)
+    buffer = await run_in_threadpool(open, file_path, "wb")
+    try:
+        if head:
+            await run_in_threadpool(_write_chunk, buffer, digest, head)
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0 and not is_pdf_header(chunk):
+                raise HTTPException(status_code=400, detail=f"File {file.filename} is not a valid PDF")
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=413, detail=f"File {file.filename} exceeds the {max_size} byte upload limit")
+            await run_in_threadpool(_write_chunk, buffer, digest, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail=f"File {file.filename} is empty")
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    await run_in_threadpool(buffer.close)
+    return size, digest.hexdigest()
+
+async def read_upload(file, file_path, memory_limit=IN_MEMORY_UPLOAD_MAX, max_size=MAX_FILE_SIZE):
+    """
+    Read an uploaded file into memory, with the same checks as save_upload.
+
+    Once the content grows past memory_limit, what was read so far and the rest of the
+    upload are streamed to file_path instead.
+
+    Returns:
+        tuple: (content as bytes, or None when it was written to file_path, size in bytes, sha256 hex digest)
+    """
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if size == 0 and not is_pdf_header(chunk):
+            raise HTTPException(status_code=400, detail=f"File {file.filename} is not a valid PDF")
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(status_code=413, detail=f"File {file.filename} exceeds the {max_size} byte upload limit")
+        chunks.append(chunk)
+        if size > memory_limit:
+            size, sha256 = await save_upload(file, file_path, max_size, head=b"".join(chunks))
+            return None, size, sha256
+    if size == 0:
+        raise HTTPException(status_code=400, detail=f"File {file.filename} is empty")
+    # Joined once, BytesIO and the PDF readers then use this buffer without copying it again
+    content = b"".join(chunks)
+    return content, size, hashlib.sha256(content).hexdigest()
+
+class ZipArchive:
+    """
+    Members of an uploaded ZIP archive, decompressed one chunk at a time as they are read.
+
+    The archive is read from the upload's spooled file in place, nothing is extracted to disk.
+    Declared sizes are checked up front, and the bytes actually decompressed count against
+    ZIP_MAX_TOTAL_SIZE, so an archive whose headers understate its content is still stopped.
+    """
+
+    def __init__(self, file, max_members=ZIP_MAX_MEMBERS, max_total_size=ZIP_MAX_TOTAL_SIZE):
+        source = file.file
+        if not hasattr(source, "seekable"):
+            # SpooledTemporaryFile only has seekable(), which zipfile needs, from Python 3.11
+            source = source._file
+        try:
+            self.archive = zipfile.ZipFile(source)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail=f"File {file.filename} is not a valid ZIP archive")
+        self.max_total_size = max_total_size
+        self.total_size = 0
+        self._members = []
+        # Folders and the resource forks macOS adds to archives are not uploads
+        self.infos = [
+            info for info in self.archive.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+            and not os.path.basename(info.filename).startswith(".")
+        ]
+        if len(self.infos) > max_members:
+            self.close()
+            raise HTTPException(status_code=413, detail=f"Archive has {len(self.infos)} files, the limit is {max_members}")
+        declared = sum(info.file_size for info in self.infos)
+        if declared > max_total_size:
+            self.close()
+            raise HTTPException(status_code=413, detail=f"Archive expands to {declared} bytes, the limit is {max_total_size}")
+
+    def members(self):
+        self._members = [ZipMember(self, info) for info in self.infos]
+        return self._members
+
+    def consume(self, size, filename):
+        self.total_size += size
+        if self.total_size > self.max_total_size:
+            raise HTTPException(status_code=413, detail=f"Archive expands past {self.max_total_size} bytes at {filename}")
+
+    def close(self):
+        # Members left unfinished by a failed check still hold a decompressor
+        for member in self._members:
+            member.close()
+        self.archive.close()
+
+class ZipMember:
+    """One archive member with the async read() of an UploadFile, so read_upload can consume it"""
+
+    def __init__(self, parent, info):
+        self.parent = parent
+        self.info = info
+        self.filename = os.path.basename(info.filename)
+        self._stream = None
+
+    def _open(self):
+        if self.info.flag_bits & 0x1:
+            raise HTTPException(status_code=400, detail=f"File {self.filename} is encrypted")
+        if self.info.compress_size and self.info.file_size / self.info.compress_size > ZIP_MAX_RATIO:
+            raise HTTPException(status_code=413, detail=f"File {self.filename} expands {self.info.file_size // self.info.compress_size}x, the limit is {ZIP_MAX_RATIO:g}x")
+        # zipfile serializes reads of the shared archive file, so members can be read from several threads
+        return self.parent.archive.open(self.info)
+
+    async def read(self, size):
+        if self._stream is None:
+            self._stream = await run_in_threadpool(self._open)
+        chunk = await run_in_threadpool(self._stream.read, size)
+        self.parent.consume(len(chunk), self.filename)
+        return chunk
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
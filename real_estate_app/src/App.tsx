@@ -34,6 +34,7 @@ function App() {
   const [error, setError] = useState<string | null>(null);
   const [success, setSuccess] = useState<string | null>(null);
   const [showPdfViewer, setShowPdfViewer] = useState(false);
+  const [reportViewUrl, setReportViewUrl] = useState<string | null>(null);
   const [hasInputMLS, setHasInputMLS] = useState(true);
   const [showInputForm, setShowInputForm] = useState(false);
   const [chatgptPrompt, setChatgptPrompt] = useState<string | null>(null);
@@ -142,10 +143,10 @@ function App() {
         response.uploaded_files &&
         !response.type_mismatch
       ) {
-        const uploadedFiles = response.uploaded_files.map((apiFile, index) => ({
-          name: pdfFiles[index].name,
-          size: pdfFiles[index].size,
-          type: pdfFiles[index].type,
+        const uploadedFiles = response.uploaded_files.map((apiFile) => ({
+          name: apiFile.filename,
+          size: apiFile.file_size,
+          type: "application/pdf",
           file_id: apiFile.file_id,
         }));
 
@@ -154,14 +155,12 @@ function App() {
           `${uploadedFiles.length} comparison file(s) uploaded successfully!`
         );
       } else if (response.success && response.type_mismatch) {
-        const uploadedFiles = response.uploaded_files?.map(
-          (apiFile, index) => ({
-            name: pdfFiles[index].name,
-            size: pdfFiles[index].size,
-            type: pdfFiles[index].type,
-            file_id: apiFile.file_id,
-          })
-        );
+        const uploadedFiles = response.uploaded_files?.map((apiFile) => ({
+          name: apiFile.filename,
+          size: apiFile.file_size,
+          type: "application/pdf",
+          file_id: apiFile.file_id,
+        }));
 
         setComparisonFiles(uploadedFiles || []);
         setSuccess(
@@ -183,6 +182,13 @@ function App() {
         setHasInputMLS(false);
         setShowInputForm(true);
       }
+      if (response.failed_files && response.failed_files.length > 0) {
+        setError(
+          `Failed to upload: ${response.failed_files
+            .map((failed) => `${failed.filename} (${failed.error})`)
+            .join(", ")}`
+        );
+      }
     } catch (err) {
       setError(err instanceof Error ? err.message : "Upload failed");
     } finally {
@@ -364,12 +370,24 @@ function App() {
     }
   };
 
-  const handleViewReport = () => {
-    setShowPdfViewer(true);
+  const handleViewReport = async () => {
+    if (!reportData?.report_id) return;
+
+    try {
+      const links = await apiService.getReportLinks(
+        reportData.report_id,
+        token!
+      );
+      setReportViewUrl(links.view_url);
+      setShowPdfViewer(true);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : "Failed to open report");
+    }
   };
 
   const handleClosePdfViewer = () => {
     setShowPdfViewer(false);
+    setReportViewUrl(null);
   };
 
   const clearMessages = () => {
@@ -1360,7 +1378,7 @@ function App() {
       </main>
 
       {/* PDF Viewer Modal */}
-      {showPdfViewer && reportData && (
+      {showPdfViewer && reportData && reportViewUrl && (
         <div className="fixed inset-0 bg-black bg-opacity-75 flex items-center justify-center z-50 p-4">
           <div className="bg-white rounded-2xl shadow-2xl w-full max-w-6xl h-full max-h-[90vh] flex flex-col">
             {/* Modal Header */}
@@ -1379,7 +1397,7 @@ function App() {
             {/* PDF Viewer */}
             <div className="flex-1 p-4">
               <iframe
-                src={apiService.getReportViewUrl(reportData.report_id, token!)}
+                src={reportViewUrl}
                 className="w-full h-full border-0 rounded-lg"
                 title="Property Analysis Report"
               />
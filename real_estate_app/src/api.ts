@@ -6,6 +6,11 @@ export interface UploadedFile {
   file_size: number;
 }
 
+export interface FailedUpload {
+  filename: string;
+  error: string;
+}
+
 export interface UploadResponse {
   success: boolean;
   message: string;
@@ -13,6 +18,7 @@ export interface UploadResponse {
   filename?: string;
   file_size?: number;
   uploaded_files?: UploadedFile[];
+  failed_files?: FailedUpload[];
   type_mismatch?: boolean;
   extracted_data?: Record<string, any>;
 }
@@ -23,6 +29,13 @@ export interface ReportData {
   appraisal_report: string[];
 }
 
+export interface ReportLinks {
+  report_id: string;
+  view_url: string;
+  download_url: string;
+  expires_at: number;
+}
+
 export interface ManualInputData {
   address: string;
   status: string;
@@ -227,9 +240,26 @@ class ApiService {
     return response.blob();
   }
 
-  // Get report view URL for embedding
-  getReportViewUrl(reportId: string, token: string): string {
-    return `${this.baseUrl}/view-report/${reportId}?token=${token}`;
+  // Get short-lived signed view and download URLs, so the token never goes in a URL
+  async getReportLinks(reportId: string, token: string): Promise<ReportLinks> {
+    const response = await fetch(`${this.baseUrl}/report-links/${reportId}`, {
+      method: "GET",
+      headers: {
+        Authorization: `Bearer ${token}`,
+      },
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json();
+      throw new Error(errorData.detail || "Failed to get report links");
+    }
+
+    const links: ReportLinks = await response.json();
+    return {
+      ...links,
+      view_url: `${this.baseUrl}${links.view_url}`,
+      download_url: `${this.baseUrl}${links.download_url}`,
+    };
   }
 
   // List uploaded files (for debugging)